@@ -0,0 +1,268 @@
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+import scrapImage
+from compositeStore import create_store
+from floodClassification import FLOOD, classify_perennial_and_non_water, classify_period, flood_mask
+from instrumentation import current_rss
+from mosaic import merge_tiles
+from scrapImage import write_world_file
+from speckleFilter import refined_lee
+from streamMosaic import stream_mosaic
+
+# === CONFIGURATION ===
+RESULTS_FILE = "benchmark_results.jsonl"
+SEED = 0
+SCALES = {
+    "small":  {"har_entries": 200,  "tile_grid": 8,  "tile_size": 256, "tile_overlap": 0.25,
+               "stack_rows": 256,  "stack_cols": 256,  "flood_patches": 20},
+    "medium": {"har_entries": 2000, "tile_grid": 24, "tile_size": 256, "tile_overlap": 0.25,
+               "stack_rows": 1024, "stack_cols": 1024, "flood_patches": 100},
+    "large":  {"har_entries": 10000, "tile_grid": 48, "tile_size": 512, "tile_overlap": 0.25,
+               "stack_rows": 2048, "stack_cols": 2048, "flood_patches": 400},
+}
+BENCH_YEAR = 2018
+BENCH_BIWEEK = 3
+TILE_PX_DEG = 0.0001
+ORIGIN = (76.0, 10.5)   # lon/lat of the top-left synthetic tile (Kerala)
+
+
+# === Peak RSS sampler for a whole stage ===
+class PeakRSS:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def run_stage(results, stage, fn, items=0, nbytes=0):
+    with PeakRSS() as rss:
+        t0 = time.perf_counter()
+        out = fn()
+        seconds = time.perf_counter() - t0
+    results.append({
+        "stage": stage,
+        "seconds": round(seconds, 6),
+        "items": items,
+        "bytes": nbytes,
+        "items_per_s": round(items / seconds, 2) if seconds > 0 and items else None,
+        "mb_per_s": round(nbytes / seconds / 1e6, 2) if seconds > 0 and nbytes else None,
+        "peak_rss_mb": round(rss.peak / 1e6, 1),
+    })
+    print(f"  {stage:<16} {seconds:9.3f}s  peak RSS {rss.peak / 1e6:8.1f} MB")
+    return out
+
+
+# === Synthetic inputs ===
+def synthetic_tile(size, rng, mode="P"):
+    index = np.zeros((size, size), dtype=np.uint8)
+    for _ in range(3):
+        r, c = rng.integers(0, size, 2)
+        h, w = rng.integers(size // 16, size // 3, 2)
+        index[r:r + h, c:c + w] = 1
+    if mode == "P":
+        img = Image.fromarray(index, mode="P")
+        img.putpalette([0, 0, 0, 0, 255, 255])
+        img.info["transparency"] = 0
+    else:
+        rgba = np.zeros((size, size, 4), dtype=np.uint8)
+        rgba[index == 1] = [0, 255, 255, 255]
+        img = Image.fromarray(rgba, mode="RGBA")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def tile_bbox(i, j, size, overlap):
+    step = size * TILE_PX_DEG * (1 - overlap)
+    xmin = ORIGIN[0] + j * step
+    ymax = ORIGIN[1] - i * step
+    return [xmin, ymax - size * TILE_PX_DEG, xmin + size * TILE_PX_DEG, ymax]
+
+
+def write_har(path, n_entries, port, size, overlap):
+    grid = int(np.ceil(np.sqrt(n_entries)))
+    entries = []
+    for k in range(n_entries):
+        bbox = tile_bbox(k // grid, k % grid, size, overlap)
+        url = (f"http://127.0.0.1:{port}/geoserver/wms?SERVICE=WMS&REQUEST=GetMap&LAYERS=flood:kl_2018_16_08"
+               f"&BBOX={','.join(map(str, bbox))}&WIDTH={size}&HEIGHT={size}&FORMAT=image/png")
+        entries.append({"request": {"method": "GET", "url": url}})
+        if k % 5 == 0:  # non-WMS noise the parser has to skip
+            entries.append({"request": {"method": "GET", "url": f"http://127.0.0.1:{port}/static/app.js"}})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"log": {"entries": entries}}, f)
+
+
+def write_tile_set(tile_dir, grid, size, overlap, rng):
+    os.makedirs(tile_dir, exist_ok=True)
+    nbytes = 0
+    for i in range(grid):
+        for j in range(grid):
+            png = synthetic_tile(size, rng)
+            path = os.path.join(tile_dir, f"tile_2018_16_08_{i * grid + j:05d}.png")
+            with open(path, "wb") as f:
+                f.write(png)
+            write_world_file(path.replace(".png", ".wld"), tile_bbox(i, j, size, overlap), size, size)
+            nbytes += len(png)
+    return nbytes
+
+
+# VV stack (dB): land around -10, a permanent river below -22 and flood patches
+# planted in (BENCH_YEAR, BENCH_BIWEEK) plus a few random other periods
+def write_vv_store(store_dir, rows, cols, n_patches, rng):
+    grid = {"projection": 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+                          'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]',
+            "transform": [ORIGIN[0], 0.00027, 0, ORIGIN[1], 0, -0.00027], "rows": rows, "cols": cols}
+    store = create_store(store_dir, grid)
+    n_years, n_biweeks = store.vv.shape[:2]
+    river = slice(rows // 2 - rows // 40, rows // 2 + rows // 40)
+    for yi in range(n_years):
+        year = rng.normal(-10, 1.5, (n_biweeks, rows, cols)).astype(np.float32)
+        year[:, river] = -23
+        store.vv[yi] = year
+    store.has_data[:] = True
+
+    planted = np.zeros((rows, cols), dtype=bool)
+    yi = store.year_index(BENCH_YEAR)
+    for _ in range(n_patches):
+        r, c = rng.integers(0, rows - 16), rng.integers(0, cols - 16)
+        h, w = rng.integers(4, 16, 2)
+        store.vv[yi, BENCH_BIWEEK, r:r + h, c:c + w] = -20
+        planted[r:r + h, c:c + w] = True
+    gaps = rng.random((n_years, n_biweeks)) < 0.1
+    gaps[yi, BENCH_BIWEEK] = False
+    store.vv[gaps] = np.nan
+    store.has_data[gaps] = False
+    store.vv.flush()
+    store.save_index()
+    return store, planted
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    payload = b""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_benchmark(scale_name):
+    scale = SCALES[scale_name]
+    rng = np.random.default_rng(SEED)
+    results = []
+    print(f"Benchmark scale: {scale_name} {scale}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # --- Scraper: HAR parse + download from a local WMS stand-in ---
+        TileHandler.payload = synthetic_tile(scale["tile_size"], rng)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        har_path = os.path.join(tmp, "bench.har")
+        write_har(har_path, scale["har_entries"], server.server_address[1], scale["tile_size"], scale["tile_overlap"])
+
+        har_size = os.path.getsize(har_path)
+        tile_urls = run_stage(results, "har_parse",
+                              lambda: scrapImage.parse_tile_urls(scrapImage.load_har(har_path)),
+                              items=scale["har_entries"], nbytes=har_size)
+        run_stage(results, "download",
+                  lambda: scrapImage.download_tiles(tile_urls, os.path.join(tmp, "downloaded"), verbose=False),
+                  items=len(tile_urls), nbytes=len(tile_urls) * len(TileHandler.payload))
+        run_stage(results, "stream_mosaic",
+                  lambda: stream_mosaic(tile_urls, os.path.join(tmp, "stream_union.tif"), verbose=False),
+                  items=len(tile_urls), nbytes=len(tile_urls) * len(TileHandler.payload))
+        server.shutdown()
+
+        # --- Merge: PNG + .wld tile set with controlled overlap ---
+        tile_dir = os.path.join(tmp, "tiles")
+        n_tiles = scale["tile_grid"] ** 2
+        png_bytes = write_tile_set(tile_dir, scale["tile_grid"], scale["tile_size"], scale["tile_overlap"], rng)
+        run_stage(results, "merge",
+                  lambda: merge_tiles(tile_dir, os.path.join(tmp, "flood_union.tif"), verbose=False),
+                  items=n_tiles, nbytes=png_bytes)
+
+        # --- Classification over a year x biweek VV stack ---
+        rows, cols = scale["stack_rows"], scale["stack_cols"]
+        store, planted = write_vv_store(os.path.join(tmp, "composites"), rows, cols, scale["flood_patches"], rng)
+        n_px = store.vv.size
+        run_stage(results, "despeckle", lambda: refined_lee(store.year_stack(BENCH_YEAR)),
+                  items=n_px // store.vv.shape[0], nbytes=store.vv[0].nbytes)
+        base, _ = run_stage(results, "classify_base", lambda: classify_perennial_and_non_water(store),
+                            items=n_px, nbytes=store.vv.nbytes)
+        classification = run_stage(results, "classify_period",
+                                   lambda: classify_period(store, base, BENCH_YEAR, BENCH_BIWEEK),
+                                   items=rows * cols)
+        mask = run_stage(results, "flood_mask", lambda: flood_mask(classification, store.grid), items=rows * cols)
+
+    recall = float((mask.astype(bool) & planted).sum() / max(planted.sum(), 1))
+    print(f"  planted flood recall: {recall:.3f} ({int((classification == FLOOD).sum())} flood pixels)")
+    return results, recall
+
+
+# === Compare against the previous run at the same scale ===
+def previous_run(results_file, scale_name):
+    if not os.path.exists(results_file):
+        return {}
+    last = {}
+    with open(results_file, "r") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    runs = [r["run_id"] for r in rows if r["scale"] == scale_name]
+    if runs:
+        last = {r["stage"]: r for r in rows if r["run_id"] == runs[-1]}
+    return last
+
+
+def record(results_file, scale_name, results, recall):
+    previous = previous_run(results_file, scale_name)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    with open(results_file, "a") as f:
+        for r in results:
+            r.update({"run_id": run_id, "scale": scale_name, "host": platform.node(),
+                      "python": platform.python_version(), "flood_recall": round(recall, 4)})
+            f.write(json.dumps(r) + "\n")
+
+            before = previous.get(r["stage"])
+            if before and before["seconds"] > 0:
+                change = 100 * (r["seconds"] - before["seconds"]) / before["seconds"]
+                flag = "  <-- slower" if change > 10 else ""
+                print(f"  {r['stage']:<16} {change:+7.1f}% vs {before['run_id']}{flag}")
+
+
+if __name__ == "__main__":
+    scale_name = sys.argv[1] if len(sys.argv) > 1 else "small"
+    results, recall = run_benchmark(scale_name)
+    record(RESULTS_FILE, scale_name, results, recall)
+    print(f"Done. Results appended to: {RESULTS_FILE}")
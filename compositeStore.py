@@ -0,0 +1,160 @@
+import json
+import os
+import numpy as np
+
+from s1Ingest import YEARS, STORE_DIR as INGEST_DIR, biweek_mean, biweek_starts, load_index
+
+# === CONFIGURATION ===
+COMPOSITE_DIR = "s1_composites"
+VV_FILE = "vv.npy"
+INDEX_FILE = "index.json"
+
+
+# On-disk layout: vv.npy is a (year, biweek, row, col) float32 memmap with NaN for
+# gaps; index.json holds the grid, has_data flags and system:time_start per slot.
+class CompositeStore:
+    def __init__(self, store_dir=COMPOSITE_DIR, mode="r"):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_FILE), "r") as f:
+            self.index = json.load(f)
+        self.vv = np.load(os.path.join(store_dir, VV_FILE), mmap_mode=mode)
+        self.years = self.index["years"]
+        self.grid = self.index["grid"]
+        self.has_data = np.array(self.index["has_data"], dtype=bool)
+        self.time_start = np.array(self.index["time_start"], dtype=np.int64)
+        self._year_pos = {y: i for i, y in enumerate(self.years)}
+
+    @property
+    def n_biweeks(self):
+        return self.vv.shape[1]
+
+    def year_index(self, year):
+        return self._year_pos[year]
+
+    # All slices below are views into the memmap; nothing is read until used.
+    def composite(self, year, biweek):
+        return self.vv[self._year_pos[year], biweek]
+
+    def year_stack(self, year):
+        return self.vv[self._year_pos[year]]
+
+    def biweek_across_years(self, biweek):
+        return self.vv[:, biweek]
+
+    def save_index(self):
+        self.index["has_data"] = self.has_data.astype(int).tolist()
+        self.index["time_start"] = self.time_start.tolist()
+        index_path = os.path.join(self.store_dir, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+
+# === Gap filling for empty bi-weeks ===
+# Every policy reduces to "gather from slot(s) src along the bi-week axis", built
+# from has_data with index tricks instead of a sequential fold:
+#   carry       - last bi-week with data (the lastImage carry-forward in compareGT.py)
+#   nearest     - closest bi-week with data, earlier one on ties
+#   interpolate - linear blend of the previous and next bi-weeks with data
+#   masked      - leave gaps as NaN (floodDetection.js / newCompareGT.js)
+# Bi-weeks before the first / after the last observation of a year have nothing to
+# carry from and stay NaN, except that nearest and interpolate reach across them.
+GAP_POLICIES = ("carry", "nearest", "interpolate", "masked")
+
+
+def gap_sources(has_data):
+    n = has_data.shape[-1]
+    pos = np.arange(n)
+    prev = np.maximum.accumulate(np.where(has_data, pos, -1), axis=-1)
+    nxt = np.minimum.accumulate(np.where(has_data, pos, n)[..., ::-1], axis=-1)[..., ::-1]
+    return prev, np.where(nxt == n, -1, nxt)
+
+
+def gap_fill_plan(has_data, policy):
+    pos = np.arange(has_data.shape[-1])
+    prev, nxt = gap_sources(has_data)
+    if policy == "carry":
+        return prev, prev, np.zeros(has_data.shape, dtype=np.float32)
+    if policy == "nearest":
+        use_next = (prev < 0) | ((nxt >= 0) & (nxt - pos < pos - prev))
+        src = np.where(use_next, nxt, prev)
+        return src, src, np.zeros(has_data.shape, dtype=np.float32)
+    if policy == "interpolate":
+        lo = np.where(prev < 0, nxt, prev)
+        hi = np.where(nxt < 0, prev, nxt)
+        span = np.where(hi > lo, hi - lo, 1)
+        return lo, hi, ((pos - lo) / span).clip(0, 1).astype(np.float32)
+    raise ValueError(f"Unknown gap policy {policy!r}, expected one of {GAP_POLICIES}")
+
+
+def fill_year(vv_year, lo, hi, weight, out):
+    # vv_year: (biweek, row, col); lo/hi/weight: (biweek,)
+    missing = lo < 0
+    out[:] = vv_year[np.where(missing, 0, lo)]
+    blend = (weight > 0) & ~missing
+    if blend.any():
+        w = weight[blend, None, None]
+        out[blend] *= 1 - w
+        out[blend] += w * vv_year[hi[blend]]
+    out[missing] = np.nan
+    return out
+
+
+def gap_filled_store(store, policy, out_dir):
+    if policy == "masked":
+        return store
+    lo, hi, weight = gap_fill_plan(store.has_data, policy)
+    filled = create_store(out_dir, store.grid, store.years)
+    for yi in range(len(store.years)):
+        fill_year(store.vv[yi], lo[yi], hi[yi], weight[yi], filled.vv[yi])
+    filled.vv.flush()
+    # has_data keeps its meaning of "had new data this period"
+    filled.has_data[:] = store.has_data
+    filled.time_start[:] = store.time_start
+    filled.index["gap_policy"] = policy
+    filled.save_index()
+    return filled
+
+
+def create_store(store_dir, grid, years=YEARS):
+    os.makedirs(store_dir, exist_ok=True)
+    n_biweeks = max(len(biweek_starts(y)) for y in years)
+    shape = (len(years), n_biweeks, grid["rows"], grid["cols"])
+    vv = np.lib.format.open_memmap(os.path.join(store_dir, VV_FILE), mode="w+", dtype=np.float32, shape=shape)
+    vv[:] = np.nan
+    vv.flush()
+    del vv
+
+    time_start = [[int(s.timestamp() * 1000) for s in biweek_starts(y)] for y in years]
+    index = {
+        "years": list(years),
+        "grid": grid,
+        "has_data": [[0] * n_biweeks for _ in years],
+        "time_start": [t + [0] * (n_biweeks - len(t)) for t in time_start],
+    }
+    with open(os.path.join(store_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f)
+    return CompositeStore(store_dir, mode="r+")
+
+
+def build_composite_store(ingest_dir=INGEST_DIR, store_dir=COMPOSITE_DIR, years=YEARS):
+    ingest_index = load_index(ingest_dir)
+    store = create_store(store_dir, ingest_index["grid"], years)
+
+    for yi, year in enumerate(years):
+        for biweek in range(len(biweek_starts(year))):
+            mean = biweek_mean(ingest_dir, ingest_index, year, biweek)
+            if mean is None:
+                continue
+            store.vv[yi, biweek] = mean
+            store.has_data[yi, biweek] = True
+        print(f"Composited {year}: {int(store.has_data[yi].sum())} bi-weeks with data")
+
+    store.vv.flush()
+    store.save_index()
+    return store
+
+
+if __name__ == "__main__":
+    store = build_composite_store()
+    print(f"Done. Composite store {store.vv.shape} saved in: {COMPOSITE_DIR}")
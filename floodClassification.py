@@ -0,0 +1,216 @@
+import numpy as np
+from osgeo import gdal, osr
+from scipy import ndimage
+
+from compositeStore import COMPOSITE_DIR, CompositeStore, gap_filled_store
+from instrumentation import span, traced
+
+# === CONFIGURATION (mirrors CONFIG in newCompareGT.js) ===
+THRESHOLD = -16
+PERENNIAL_THRESHOLD = 0.90
+WEEK_FREQ = 0.6
+YEAR_FREQ = 0.9
+SMUDGE_RADIUS_M = 36
+GAP_POLICY = "masked"        # carry | nearest | interpolate | masked (see compositeStore.GAP_POLICIES)
+FILLED_DIR = "s1_composites_filled"
+SELECTED_YEAR = 2018
+SELECTED_BIWEEK = 3
+OUTPUT_PATH = "flood_classification.tif"
+
+# All-periods batch mode (runBatchProcessing in floodDetection.js, without the per-period loop)
+BATCH_MODE = False
+BATCH_CLASSIFICATION = "flood_classification_all.npy"   # (year, biweek, row, col) uint8
+BATCH_FLOOD = "flood_raster_all.npy"                     # smudged flood masks, same layout
+BATCH_GEOTIFF = "flood_raster_all.tif"                   # one band per (year, biweek)
+ROW_CHUNK = 256
+
+# Class codes used throughout the GEE scripts
+UNCLASSIFIED, PERENNIAL, NON_WATER, SEASONAL, FLOOD = 0, 1, 2, 3, 4
+
+
+# Water mask of a composite (or any stack of them): 1 where VV < threshold,
+# with NaN gaps reported separately as "not valid" (masked in GEE).
+def water_and_valid(vv, threshold=THRESHOLD):
+    vv = np.asarray(vv)
+    valid = np.isfinite(vv)
+    return valid & (vv < threshold), valid
+
+
+# Sum of water / number of valid observations along `axis`, NaN where nothing was observed
+def water_frequency(vv, threshold=THRESHOLD, axis=0):
+    water, valid = water_and_valid(vv, threshold)
+    water_sum = water.sum(axis=axis, dtype=np.float32)
+    valid_count = valid.sum(axis=axis, dtype=np.float32)
+    return ratio(water_sum, valid_count)
+
+
+def ratio(water_sum, valid_count):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid_count > 0, water_sum / valid_count, np.nan).astype(np.float32)
+
+
+def base_from_frequency(freq, perennial_threshold=PERENNIAL_THRESHOLD):
+    base = np.full(freq.shape, UNCLASSIFIED, dtype=np.uint8)
+    base[freq >= perennial_threshold] = PERENNIAL
+    base[freq == 0] = NON_WATER
+    return base
+
+
+# === STEP 1: perennial / non-water base from the whole archive ===
+@traced("classify_base")
+def classify_perennial_and_non_water(store, threshold=THRESHOLD, perennial_threshold=PERENNIAL_THRESHOLD):
+    shape = store.vv.shape[2:]
+    water_sum = np.zeros(shape, dtype=np.float32)
+    valid_count = np.zeros(shape, dtype=np.float32)
+    for year in store.years:  # one year at a time keeps memory at a single year slab
+        water, valid = water_and_valid(store.year_stack(year), threshold)
+        water_sum += water.sum(axis=0, dtype=np.float32)
+        valid_count += valid.sum(axis=0, dtype=np.float32)
+
+    freq = ratio(water_sum, valid_count)
+    return base_from_frequency(freq, perennial_threshold), freq
+
+
+# === STEP 2: seasonal / flood / temporary non-water for one (year, biweek) ===
+@traced("classify_period")
+def classify_period(store, base, year, biweek, year_freq=YEAR_FREQ, week_freq=WEEK_FREQ, threshold=THRESHOLD):
+    water_now, valid_now = water_and_valid(store.composite(year, biweek), threshold)
+    freq_year = water_frequency(store.year_stack(year), threshold)
+    freq_biweek = water_frequency(store.biweek_across_years(biweek), threshold)
+    return classify_from_frequencies(base, water_now, valid_now, freq_year, freq_biweek, year_freq, week_freq)
+
+
+# Works on a single period or, by broadcasting, on whole (year, biweek, ...) cubes
+def classify_from_frequencies(base, water_now, valid_now, freq_year, freq_biweek, year_freq, week_freq):
+    unclassified = base == UNCLASSIFIED
+    wet = unclassified & water_now
+
+    seasonal = wet & (
+        ((freq_biweek >= week_freq) & (freq_year < year_freq))
+        | ((freq_biweek <= week_freq) & (freq_year > year_freq))
+    )
+    flood = wet & (freq_biweek < week_freq)
+    new_perennial = wet & (freq_year >= year_freq) & (freq_biweek >= week_freq)
+    temporary_non_water = unclassified & valid_now & ~water_now
+
+    classification = np.array(np.broadcast_to(base, temporary_non_water.shape))
+    classification[temporary_non_water] = NON_WATER
+    classification[seasonal] = SEASONAL
+    classification[flood] = FLOOD
+    classification[new_perennial] = PERENNIAL
+    return classification
+
+
+# === Flood raster (createFloodWaterMask): seasonal + flood, smudged by focal_max ===
+def pixel_size_m(grid):
+    srs = osr.SpatialReference(wkt=grid["projection"])
+    px_w, px_h = grid["transform"][1], abs(grid["transform"][5])
+    if srs.IsGeographic():
+        lat = grid["transform"][3] + grid["rows"] * grid["transform"][5] / 2
+        return px_w * 111320.0 * np.cos(np.radians(lat)), px_h * 111320.0
+    return px_w, px_h
+
+
+def disk_kernel(radius_m, px_x_m, px_y_m):
+    rx, ry = int(radius_m // px_x_m), int(radius_m // px_y_m)
+    y, x = np.ogrid[-ry:ry + 1, -rx:rx + 1]
+    return (x * px_x_m) ** 2 + (y * px_y_m) ** 2 <= radius_m ** 2
+
+
+@traced("flood_mask")
+def flood_mask(classification, grid, radius_m=SMUDGE_RADIUS_M):
+    mask = (classification == SEASONAL) | (classification == FLOOD)
+    kernel = disk_kernel(radius_m, *pixel_size_m(grid))
+    if kernel.size > 1:
+        mask = ndimage.binary_dilation(mask, structure=kernel)
+    return mask.astype(np.uint8)
+
+
+# === All periods in one pass ===
+# Each row slab of the (year, biweek, row, col) cube is read once; the archive,
+# per-year and per-biweek frequencies are reductions over its axes, and every
+# (year, biweek) classification comes out of one broadcast. Slabs carry a halo of
+# the smudge radius so the flood masks match a full-raster focal_max.
+@traced("classify_all_periods")
+def classify_all_periods(store, out, flood_out=None, year_freq=YEAR_FREQ, week_freq=WEEK_FREQ,
+                         threshold=THRESHOLD, perennial_threshold=PERENNIAL_THRESHOLD,
+                         radius_m=SMUDGE_RADIUS_M, row_chunk=ROW_CHUNK):
+    n_rows = store.vv.shape[2]
+    kernel = disk_kernel(radius_m, *pixel_size_m(store.grid))
+    halo = kernel.shape[0] // 2 if flood_out is not None else 0
+
+    for r0 in range(0, n_rows, row_chunk):
+        r1 = min(r0 + row_chunk, n_rows)
+        lo, hi = max(r0 - halo, 0), min(r1 + halo, n_rows)
+        keep = slice(r0 - lo, r1 - lo)
+
+        water, valid = water_and_valid(store.vv[:, :, lo:hi], threshold)
+        base = base_from_frequency(
+            ratio(water.sum(axis=(0, 1), dtype=np.float32), valid.sum(axis=(0, 1), dtype=np.float32)),
+            perennial_threshold)
+        freq_year = ratio(water.sum(axis=1, dtype=np.float32), valid.sum(axis=1, dtype=np.float32))
+        freq_biweek = ratio(water.sum(axis=0, dtype=np.float32), valid.sum(axis=0, dtype=np.float32))
+
+        classification = classify_from_frequencies(
+            base, water, valid, freq_year[:, None], freq_biweek[None], year_freq, week_freq)
+        out[:, :, r0:r1] = classification[:, :, keep]
+
+        if flood_out is not None:
+            mask = (classification == SEASONAL) | (classification == FLOOD)
+            if kernel.size > 1:
+                mask = ndimage.binary_dilation(mask, structure=kernel[None, None])
+            flood_out[:, :, r0:r1] = mask[:, :, keep]
+
+    return out
+
+
+def write_period_stack(path, cube, grid, years):
+    n_years, n_biweeks = cube.shape[:2]
+    with span("write", nbytes=cube.nbytes, items=n_years * n_biweeks):
+        driver = gdal.GetDriverByName("GTiff")
+        out_ds = driver.Create(path, grid["cols"], grid["rows"], n_years * n_biweeks, gdal.GDT_Byte,
+                               ["TILED=YES", "COMPRESS=DEFLATE", "INTERLEAVE=BAND", "BIGTIFF=IF_SAFER"])
+        out_ds.SetGeoTransform(grid["transform"])
+        out_ds.SetProjection(grid["projection"])
+        for yi, year in enumerate(years):
+            for biweek in range(n_biweeks):
+                band = out_ds.GetRasterBand(yi * n_biweeks + biweek + 1)
+                band.SetDescription(f"{year}_biweek_{biweek}")
+                band.WriteArray(np.asarray(cube[yi, biweek]))
+        out_ds.FlushCache()
+        out_ds = None
+
+
+def write_geotiff(path, array, grid, nodata=None):
+    dtype = gdal.GDT_Byte if array.dtype == np.uint8 else gdal.GDT_Float32
+    with span("write", nbytes=array.nbytes, items=1):
+        driver = gdal.GetDriverByName("GTiff")
+        out_ds = driver.Create(path, grid["cols"], grid["rows"], 1, dtype, ["TILED=YES", "COMPRESS=DEFLATE"])
+        out_ds.SetGeoTransform(grid["transform"])
+        out_ds.SetProjection(grid["projection"])
+        out_ds.GetRasterBand(1).WriteArray(array)
+        if nodata is not None:
+            out_ds.GetRasterBand(1).SetNoDataValue(nodata)
+        out_ds.FlushCache()
+        out_ds = None
+
+
+if __name__ == "__main__":
+    store = gap_filled_store(CompositeStore(COMPOSITE_DIR), GAP_POLICY, FILLED_DIR)
+
+    if BATCH_MODE:
+        shape = store.vv.shape
+        cube = np.lib.format.open_memmap(BATCH_CLASSIFICATION, mode="w+", dtype=np.uint8, shape=shape)
+        flood = np.lib.format.open_memmap(BATCH_FLOOD, mode="w+", dtype=np.uint8, shape=shape)
+        classify_all_periods(store, cube, flood)
+        write_period_stack(BATCH_GEOTIFF, flood, store.grid, store.years)
+        print(f"Classified {shape[0] * shape[1]} periods in one pass.")
+        print("Flood rasters saved to:", BATCH_GEOTIFF)
+    else:
+        base, _ = classify_perennial_and_non_water(store)
+        print("Base classification complete.")
+
+        classification = classify_period(store, base, SELECTED_YEAR, SELECTED_BIWEEK)
+        write_geotiff(OUTPUT_PATH, classification, store.grid)
+        print(f"Flood pixels: {int((classification == FLOOD).sum())}")
+        print("Classification saved to:", OUTPUT_PATH)
@@ -0,0 +1,129 @@
+import json
+import os
+from fractions import Fraction
+
+import numpy as np
+
+from compositeStore import COMPOSITE_DIR, CompositeStore
+from floodClassification import (FLOOD, NON_WATER, PERENNIAL, PERENNIAL_THRESHOLD, ROW_CHUNK, SEASONAL, THRESHOLD,
+                                 UNCLASSIFIED, base_from_frequency, classify_from_frequencies, ratio,
+                                 water_and_valid)
+from instrumentation import span, traced
+
+# === CONFIGURATION ===
+CODES_FILE = "flood_codes.npy"          # (year, biweek, row, col) uint16
+CODES_INDEX = "flood_codes.json"
+
+# Once the VV and perennial thresholds are fixed, a pixel's class for any
+# (weekFreq, yearFreq) depends only on its base class, whether it is wet/dry/unseen
+# this period, and the two frequencies - ratios of small integer counts
+# (<= years for the bi-week, <= bi-weeks for the year). Codes 0-3 are the
+# threshold-independent states; wet pixels get 4 + ib * n_year_fracs + iy where
+# ib / iy index the sorted distinct values those ratios can take.
+STATE_CLASS = np.array([PERENNIAL, NON_WATER, UNCLASSIFIED, NON_WATER], dtype=np.uint8)
+WET = 4
+
+
+def fraction_table(max_den):
+    values = sorted({Fraction(n, d) for d in range(1, max_den + 1) for n in range(d + 1)})
+    position = {v: i for i, v in enumerate(values)}
+    index = np.zeros((max_den + 1, max_den + 1), dtype=np.uint16)
+    for d in range(1, max_den + 1):
+        for n in range(d + 1):
+            index[n, d] = position[Fraction(n, d)]
+    return np.array([float(v) for v in values]), index
+
+
+def encode(base, water_now, valid_now, water_b, valid_b, water_y, valid_y, index_b, index_y, n_y):
+    codes = np.full(water_now.shape, 2, dtype=np.uint16)  # unclassified and not seen this period
+    codes[np.broadcast_to(base == PERENNIAL, codes.shape)] = 0
+    codes[np.broadcast_to(base == NON_WATER, codes.shape)] = 1
+    unclassified = np.broadcast_to(base == UNCLASSIFIED, codes.shape)
+    codes[unclassified & valid_now & ~water_now] = 3
+
+    wet = unclassified & water_now
+    ib = index_b[np.broadcast_to(water_b, codes.shape)[wet], np.broadcast_to(valid_b, codes.shape)[wet]]
+    iy = index_y[np.broadcast_to(water_y, codes.shape)[wet], np.broadcast_to(valid_y, codes.shape)[wet]]
+    codes[wet] = WET + ib.astype(np.uint16) * n_y + iy
+    return codes
+
+
+@traced("encode_all_periods")
+def encode_all_periods(store, out, threshold=THRESHOLD, perennial_threshold=PERENNIAL_THRESHOLD, row_chunk=ROW_CHUNK):
+    n_years, n_biweeks, n_rows = store.vv.shape[:3]
+    fracs_b, index_b = fraction_table(n_years)
+    fracs_y, index_y = fraction_table(n_biweeks)
+
+    for r0 in range(0, n_rows, row_chunk):
+        r1 = min(r0 + row_chunk, n_rows)
+        water, valid = water_and_valid(store.vv[:, :, r0:r1], threshold)
+        base = base_from_frequency(
+            ratio(water.sum(axis=(0, 1), dtype=np.float32), valid.sum(axis=(0, 1), dtype=np.float32)),
+            perennial_threshold)
+        out[:, :, r0:r1] = encode(
+            base, water, valid,
+            water.sum(axis=0)[None], valid.sum(axis=0)[None],
+            water.sum(axis=1)[:, None], valid.sum(axis=1)[:, None],
+            index_b, index_y, len(fracs_y))
+
+    return {"fractions_biweek": fracs_b.tolist(), "fractions_year": fracs_y.tolist(),
+            "threshold": threshold, "perennial_threshold": perennial_threshold,
+            "years": store.years, "grid": store.grid}
+
+
+# === Materialising a threshold pair: build a tiny LUT, then one gather ===
+def classification_lut(fracs_b, fracs_y, year_freq, week_freq):
+    fb = np.repeat(fracs_b, len(fracs_y)).astype(np.float32)
+    fy = np.tile(fracs_y, len(fracs_b)).astype(np.float32)
+    wet = np.ones(fb.shape, dtype=bool)
+    wet_classes = classify_from_frequencies(
+        np.zeros(fb.shape, dtype=np.uint8), wet, wet, fy, fb, year_freq, week_freq)
+    return np.concatenate([STATE_CLASS, wet_classes])
+
+
+class FloodCodes:
+    def __init__(self, codes_file=CODES_FILE, index_file=CODES_INDEX):
+        with open(index_file, "r") as f:
+            self.index = json.load(f)
+        self.codes = np.load(codes_file, mmap_mode="r")
+        self.years = self.index["years"]
+        self.grid = self.index["grid"]
+        self.fracs_b = np.array(self.index["fractions_biweek"])
+        self.fracs_y = np.array(self.index["fractions_year"])
+
+    def lut(self, year_freq, week_freq):
+        return classification_lut(self.fracs_b, self.fracs_y, year_freq, week_freq)
+
+    def period_codes(self, year, biweek, window=None):
+        codes = self.codes[self.years.index(year), biweek]
+        if window is not None:
+            r0, r1, c0, c1 = window
+            codes = codes[r0:r1, c0:c1]
+        return codes
+
+    def classification(self, year, biweek, year_freq, week_freq, window=None):
+        with span("codes_lookup", items=1):
+            return self.lut(year_freq, week_freq)[self.period_codes(year, biweek, window)]
+
+    def flood(self, year, biweek, year_freq, week_freq, window=None):
+        lut = self.lut(year_freq, week_freq)
+        flood_lut = ((lut == SEASONAL) | (lut == FLOOD)).astype(np.uint8)
+        with span("codes_lookup", items=1):
+            return flood_lut[self.period_codes(year, biweek, window)]
+
+
+def build_codes(store, codes_file=CODES_FILE, index_file=CODES_INDEX, **kwargs):
+    out = np.lib.format.open_memmap(codes_file, mode="w+", dtype=np.uint16, shape=store.vv.shape)
+    index = encode_all_periods(store, out, **kwargs)
+    out.flush()
+    with open(index_file + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_file + ".tmp", index_file)
+    return FloodCodes(codes_file, index_file)
+
+
+if __name__ == "__main__":
+    codes = build_codes(CompositeStore(COMPOSITE_DIR))
+    print(f"Encoded {codes.codes.shape[0] * codes.codes.shape[1]} periods; "
+          f"{len(codes.fracs_b) * len(codes.fracs_y) + WET} distinct codes")
+    print("Codes saved to:", CODES_FILE)
@@ -0,0 +1,219 @@
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from scipy import ndimage
+
+from floodClassification import FLOOD, SEASONAL, SMUDGE_RADIUS_M, WEEK_FREQ, YEAR_FREQ, disk_kernel, pixel_size_m
+from floodCodes import CODES_FILE, CODES_INDEX, FloodCodes
+from instrumentation import span
+from tilePyramid import PALETTES, LRUCache, colorize
+from zonalStats import pixel_area_m2
+
+# === CONFIGURATION ===
+HOST = "127.0.0.1"
+PORT = 8010
+WORKERS = os.cpu_count()
+CACHE_BYTES = 512 * 1024 * 1024
+LOAD_INTO_MEMORY = True     # copy the code cube into RAM instead of paging it from disk
+
+# Replaces the yearSelect / biWeekSelect / "Generate Flood Map" round trip in
+# floodDetection.js: the codes (frequency cubes + base classification folded
+# together, see floodCodes.py) are loaded once and every request is a LUT gather.
+#
+#   GET /meta
+#   GET /stats?year=2018&biweek=3&weekFreq=0.6&yearFreq=0.9&bbox=xmin,ymin,xmax,ymax
+#   GET /map?year=...&biweek=...[&smudge=1][&format=png|npy]
+# bbox is in the grid's CRS; weekFreq / yearFreq default to the CONFIG values.
+
+
+class FloodQueryEngine:
+    def __init__(self, codes_file=CODES_FILE, index_file=CODES_INDEX, in_memory=LOAD_INTO_MEMORY,
+                 cache_bytes=CACHE_BYTES):
+        self.codes = FloodCodes(codes_file, index_file)
+        if in_memory:
+            self.codes.codes = np.ascontiguousarray(self.codes.codes)
+        self.grid = self.codes.grid
+        self.px_x_m, self.px_y_m = pixel_size_m(self.grid)
+        self.row_area_m2 = pixel_area_m2(self.grid)
+        self.cache = LRUCache(cache_bytes)
+        self._luts = LRUCache(16 * 1024 * 1024)
+
+    def window(self, bbox):
+        if bbox is None:
+            return None
+        x_min, px_w, _, y_max, _, px_h = self.grid["transform"]
+        xmin, ymin, xmax, ymax = bbox
+        c0 = int(np.clip(np.floor((xmin - x_min) / px_w), 0, self.grid["cols"]))
+        c1 = int(np.clip(np.ceil((xmax - x_min) / px_w), 0, self.grid["cols"]))
+        r0 = int(np.clip(np.floor((ymax - y_max) / px_h), 0, self.grid["rows"]))
+        r1 = int(np.clip(np.ceil((ymin - y_max) / px_h), 0, self.grid["rows"]))
+        return r0, r1, c0, c1
+
+    def lut(self, year_freq, week_freq):
+        key = (year_freq, week_freq)
+        lut = self._luts.get(key)
+        if lut is None:
+            lut = self.codes.lut(year_freq, week_freq)
+            self._luts.put(key, lut, lut.nbytes)
+        return lut
+
+    def check_period(self, year, biweek):
+        if year not in self.codes.years:
+            raise ValueError(f"year {year} not in {self.codes.years}")
+        n_biweeks = self.codes.codes.shape[1]
+        if not 0 <= biweek < n_biweeks:
+            raise ValueError(f"biweek {biweek} outside 0..{n_biweeks - 1}")
+
+    def classification(self, year, biweek, year_freq, week_freq, window):
+        self.check_period(year, biweek)
+        key = ("cls", year, biweek, year_freq, week_freq, window)
+        cls = self.cache.get(key)
+        if cls is None:
+            with span("classify", items=1):
+                cls = self.lut(year_freq, week_freq)[self.codes.period_codes(year, biweek, window)]
+            self.cache.put(key, cls, cls.nbytes)
+        return cls
+
+    def flood(self, year, biweek, year_freq, week_freq, window, smudge):
+        key = ("flood", year, biweek, year_freq, week_freq, window, smudge)
+        mask = self.cache.get(key)
+        if mask is None:
+            kernel = disk_kernel(SMUDGE_RADIUS_M, self.px_x_m, self.px_y_m) if smudge else np.ones((1, 1), bool)
+            # Classify the window plus a smudge-radius halo so the dilation at its
+            # edges sees the same neighbours as a full-raster run, then crop
+            r0, r1, c0, c1 = window if window is not None else (0, self.grid["rows"], 0, self.grid["cols"])
+            halo_r, halo_c = kernel.shape[0] // 2, kernel.shape[1] // 2
+            lo_r, hi_r = max(r0 - halo_r, 0), min(r1 + halo_r, self.grid["rows"])
+            lo_c, hi_c = max(c0 - halo_c, 0), min(c1 + halo_c, self.grid["cols"])
+            cls = self.classification(year, biweek, year_freq, week_freq, (lo_r, hi_r, lo_c, hi_c))
+            mask = (cls == SEASONAL) | (cls == FLOOD)
+            if kernel.size > 1:
+                mask = ndimage.binary_dilation(mask, structure=kernel)
+            mask = mask[r0 - lo_r:r1 - lo_r, c0 - lo_c:c1 - lo_c].astype(np.uint8)
+            self.cache.put(key, mask, mask.nbytes)
+        return mask
+
+    def stats(self, year, biweek, year_freq, week_freq, window):
+        key = ("stats", year, biweek, year_freq, week_freq, window)
+        result = self.cache.get(key)
+        if result is None:
+            cls = self.classification(year, biweek, year_freq, week_freq, window)
+            counts = np.bincount(cls.ravel(), minlength=6)
+            # Pixel area shrinks with latitude on a geographic grid, so weight each row by its own
+            r0, r1 = (window[0], window[1]) if window is not None else (0, self.grid["rows"])
+            row_area = self.row_area_m2[r0:r1]
+            flood_area = float((cls == FLOOD).sum(axis=1) @ row_area)
+            seasonal_area = float((cls == SEASONAL).sum(axis=1) @ row_area)
+            result = {
+                "year": year, "biweek": biweek, "weekFreq": week_freq, "yearFreq": year_freq,
+                "window": window, "pixels": int(cls.size),
+                "class_counts": {str(k): int(v) for k, v in enumerate(counts) if v},
+                "flood_pixels": int(counts[FLOOD]),
+                "seasonal_pixels": int(counts[SEASONAL]),
+                "flood_area_m2": flood_area,
+                "flood_and_seasonal_area_m2": flood_area + seasonal_area,
+            }
+            self.cache.put(key, result, 1024)
+        return result
+
+    def meta(self):
+        return {"years": self.codes.years, "biweeks": int(self.codes.codes.shape[1]),
+                "grid": self.grid, "threshold": self.codes.index["threshold"],
+                "perennial_threshold": self.codes.index["perennial_threshold"]}
+
+
+def parse_query(query):
+    qs = parse_qs(query)
+    bbox = qs.get("bbox", [None])[0]
+    return {
+        "year": int(qs["year"][0]),
+        "biweek": int(qs["biweek"][0]),
+        "week_freq": float(qs.get("weekFreq", [WEEK_FREQ])[0]),
+        "year_freq": float(qs.get("yearFreq", [YEAR_FREQ])[0]),
+        "bbox": tuple(map(float, bbox.split(","))) if bbox else None,
+        "smudge": qs.get("smudge", ["0"])[0] == "1",
+        "format": qs.get("format", ["png"])[0],
+    }
+
+
+def make_handler(engine):
+    class FloodRequestHandler(BaseHTTPRequestHandler):
+        def send_body(self, body, content_type, status=200):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, obj, status=200):
+            self.send_body(json.dumps(obj).encode(), "application/json", status)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == "/meta":
+                    self.send_json(engine.meta())
+                    return
+
+                q = parse_query(url.query)
+                window = engine.window(q["bbox"])
+                if url.path == "/stats":
+                    self.send_json(engine.stats(q["year"], q["biweek"], q["year_freq"], q["week_freq"], window))
+                elif url.path == "/map":
+                    mask = engine.flood(q["year"], q["biweek"], q["year_freq"], q["week_freq"], window, q["smudge"])
+                    buf = io.BytesIO()
+                    if q["format"] == "npy":
+                        np.save(buf, mask)
+                        self.send_body(buf.getvalue(), "application/octet-stream")
+                    else:
+                        colorize(mask, PALETTES["flood"], "png").save(buf, format="PNG")
+                        self.send_body(buf.getvalue(), "image/png")
+                else:
+                    self.send_json({"error": f"unknown endpoint {url.path}"}, 404)
+            except (KeyError, ValueError, IndexError) as e:
+                self.send_json({"error": f"bad request: {e}"}, 400)
+
+        def log_message(self, *args):
+            pass
+
+    return FloodRequestHandler
+
+
+# HTTPServer that hands each connection to a fixed thread pool
+class PooledHTTPServer(HTTPServer):
+    def __init__(self, address, handler, workers=WORKERS):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def serve(host=HOST, port=PORT, workers=WORKERS):
+    print("Loading flood codes...")
+    engine = FloodQueryEngine()
+    server = PooledHTTPServer((host, port), make_handler(engine), workers)
+    print(f"Flood map service at http://{host}:{port} ({workers} workers)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,226 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+from scipy import ndimage
+
+from gtPolygons import polygon_areas
+from instrumentation import span
+
+# === CONFIGURATION ===
+INPUT_RASTER = "flood_raster.tif"     # any raster where > 0 means flooded (flood_mask output, Merge union, ...)
+INPUT_BAND = 1
+OUTPUT_PATH = "flood_polygons.fgb"    # .fgb -> FlatGeobuf, .gpkg -> GeoPackage
+MIN_AREA_SQM = 0                      # CONFIG.minAreaSqm
+TILE_SIZE = 2048
+WORKERS = os.cpu_count()
+WRITE_BATCH = 10000                   # features per transaction
+
+DRIVERS = {".fgb": "FlatGeobuf", ".gpkg": "GPKG"}
+EIGHT = np.ones((3, 3), dtype=bool)   # reduceToVectors joins diagonal neighbours
+
+# Each tile is labelled (8-connected) and polygonized on its own. A component that
+# doesn't reach the tile edge is final and is written straight away; components on
+# an edge are kept with their tile's border label strips, and once all tiles are in,
+# labels that touch across a seam are joined with union-find and their polygons
+# unioned. Memory is one tile per worker plus the seam polygons.
+
+
+def tile_windows(cols, rows, tile_size=TILE_SIZE):
+    return [(ti, tj, tj * tile_size, ti * tile_size, min(tile_size, cols - tj * tile_size),
+             min(tile_size, rows - ti * tile_size))
+            for ti in range((rows + tile_size - 1) // tile_size)
+            for tj in range((cols + tile_size - 1) // tile_size)]
+
+
+# === Step 1: Label + polygonize one tile (worker process, one open dataset each) ===
+_worker = {}
+
+
+def _open_source(path, band):
+    _worker["ds"] = gdal.Open(path)
+    _worker["band"] = band
+
+
+def polygonize_tile(window):
+    ti, tj, x0, y0, w, h = window
+    ds = _worker["ds"]
+    with span("vectorize", items=1) as s:
+        mask = ds.GetRasterBand(_worker["band"]).ReadAsArray(x0, y0, w, h) > 0
+        s.add(nbytes=mask.size)
+        labels, n = ndimage.label(mask, structure=EIGHT)
+        edges = {"top": labels[0].copy(), "bottom": labels[-1].copy(),
+                 "left": labels[:, 0].copy(), "right": labels[:, -1].copy()}
+        if n == 0:
+            return ti, tj, [], edges
+
+        gt = ds.GetGeoTransform()
+        mem = gdal.GetDriverByName("MEM").Create("", w, h, 1, gdal.GDT_Int32)
+        mem.SetGeoTransform([gt[0] + x0 * gt[1] + y0 * gt[2], gt[1], gt[2],
+                             gt[3] + x0 * gt[4] + y0 * gt[5], gt[4], gt[5]])
+        mem.SetProjection(ds.GetProjection())
+        band = mem.GetRasterBand(1)
+        band.WriteArray(labels.astype(np.int32))
+
+        layer_ds = ogr.GetDriverByName("Memory").CreateDataSource("")
+        layer = layer_ds.CreateLayer("tile", None, ogr.wkbPolygon)
+        layer.CreateField(ogr.FieldDefn("label", ogr.OFTInteger))
+        gdal.Polygonize(band, band, layer, 0, ["8CONNECTED=8"])
+
+        # Polygonize can split a diagonal-only component; group pieces by label
+        pieces = {}
+        for feat in layer:
+            pieces.setdefault(feat.GetField("label"), []).append(feat.GetGeometryRef().ExportToWkb())
+    return ti, tj, sorted(pieces.items()), edges
+
+
+# === Step 2: Which (tile, label) pairs touch across seams ===
+def seam_pairs(a, b):
+    # a, b: label strips on both sides of a seam; 8-connectivity also joins k with k +- 1
+    pairs = set()
+    for shift in (-1, 0, 1):
+        lo, hi = max(0, shift), min(len(a), len(b) + shift)
+        if hi <= lo:
+            continue
+        left, right = a[lo:hi], b[lo - shift:hi - shift]
+        both = (left > 0) & (right > 0)
+        pairs.update(zip(left[both].tolist(), right[both].tolist()))
+    return pairs
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+def stitch(edges):
+    uf = UnionFind()
+    for (ti, tj), e in edges.items():
+        if (ti, tj + 1) in edges:
+            for a, b in seam_pairs(e["right"], edges[(ti, tj + 1)]["left"]):
+                uf.union((ti, tj, a), (ti, tj + 1, b))
+        if (ti + 1, tj) in edges:
+            below = edges[(ti + 1, tj)]
+            for a, b in seam_pairs(e["bottom"], below["top"]):
+                uf.union((ti, tj, a), (ti + 1, tj, b))
+        # Corner-only contacts with the diagonal tiles
+        if (ti + 1, tj + 1) in edges and e["bottom"][-1] and edges[(ti + 1, tj + 1)]["top"][0]:
+            uf.union((ti, tj, e["bottom"][-1]), (ti + 1, tj + 1, edges[(ti + 1, tj + 1)]["top"][0]))
+        if (ti + 1, tj - 1) in edges and e["bottom"][0] and edges[(ti + 1, tj - 1)]["top"][-1]:
+            uf.union((ti, tj, e["bottom"][0]), (ti + 1, tj - 1, edges[(ti + 1, tj - 1)]["top"][-1]))
+    return uf
+
+
+# === Step 3: Streaming writer with latitude-corrected area ===
+class PolygonWriter:
+    def __init__(self, path, srs, min_area=MIN_AREA_SQM):
+        driver = ogr.GetDriverByName(DRIVERS[os.path.splitext(path)[1].lower()])
+        if os.path.exists(path):
+            driver.DeleteDataSource(path)
+        self.ds = driver.CreateDataSource(path)
+        self.srs = srs
+        # Areas use the same sphere as gtPolygons (ee.Geometry.area), on lon / lat
+        self.to_wgs84 = None
+        if not srs.IsGeographic():
+            wgs84 = osr.SpatialReference()
+            wgs84.ImportFromEPSG(4326)
+            wgs84.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            self.to_wgs84 = osr.CoordinateTransformation(srs, wgs84)
+        self.layer = self.ds.CreateLayer("flood", srs, ogr.wkbMultiPolygon)
+        self.layer.CreateField(ogr.FieldDefn("id", ogr.OFTInteger64))
+        self.layer.CreateField(ogr.FieldDefn("area_m2", ogr.OFTReal))
+        self.defn = self.layer.GetLayerDefn()
+        self.min_area = min_area
+        self.count = 0
+        self.pending = 0
+        self.layer.StartTransaction()
+
+    def write(self, geom):
+        geom.AssignSpatialReference(self.srs)
+        lonlat = geom
+        if self.to_wgs84 is not None:
+            lonlat = geom.Clone()
+            lonlat.Transform(self.to_wgs84)
+        area = float(polygon_areas([lonlat])[0])  # feature.geometry().area() in GEE
+        if area < self.min_area:
+            return
+        feat = ogr.Feature(self.defn)
+        feat.SetField("id", self.count)
+        feat.SetField("area_m2", area)
+        feat.SetGeometry(ogr.ForceToMultiPolygon(geom))
+        self.layer.CreateFeature(feat)
+        self.count += 1
+        self.pending += 1
+        if self.pending >= WRITE_BATCH:
+            self.layer.CommitTransaction()
+            self.layer.StartTransaction()
+            self.pending = 0
+
+    def close(self):
+        self.layer.CommitTransaction()
+        self.layer = None
+        self.ds = None
+
+
+def merge_pieces(wkbs):
+    if len(wkbs) == 1:
+        return ogr.CreateGeometryFromWkb(wkbs[0])
+    multi = ogr.Geometry(ogr.wkbMultiPolygon)
+    for wkb in wkbs:
+        multi.AddGeometry(ogr.CreateGeometryFromWkb(wkb))  # Polygonize emits plain polygons
+    return multi.UnionCascaded()
+
+
+def vectorize(input_path=INPUT_RASTER, output_path=OUTPUT_PATH, band=INPUT_BAND, tile_size=TILE_SIZE,
+              workers=WORKERS, min_area=MIN_AREA_SQM):
+    ds = gdal.Open(input_path)
+    srs = osr.SpatialReference(wkt=ds.GetProjection())
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    windows = tile_windows(ds.RasterXSize, ds.RasterYSize, tile_size)
+    ds = None
+
+    writer = PolygonWriter(output_path, srs, min_area)
+    edges, seam_pieces = {}, {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_source, initargs=(input_path, band)) as pool:
+        for ti, tj, pieces, e in pool.map(polygonize_tile, windows):
+            edges[(ti, tj)] = e
+            edge_labels = set(np.concatenate([e["top"], e["bottom"], e["left"], e["right"]]).tolist())
+            for label, wkbs in pieces:
+                if label in edge_labels:
+                    seam_pieces[(ti, tj, label)] = wkbs
+                else:
+                    writer.write(merge_pieces(wkbs))  # interior component, final already
+
+    with span("vectorize_stitch", items=len(seam_pieces)):
+        uf = stitch(edges)
+        groups = {}
+        for key, wkbs in seam_pieces.items():
+            groups.setdefault(uf.find(key), []).extend(wkbs)
+        for wkbs in groups.values():
+            writer.write(merge_pieces(wkbs))
+
+    n = writer.count
+    writer.close()
+    print(f"{len(windows)} tiles, {len(seam_pieces)} seam pieces stitched into {len(groups)} polygons")
+    return n
+
+
+if __name__ == "__main__":
+    n = vectorize()
+    print(f"Flood polygons: {n}")
+    print("Saved to:", OUTPUT_PATH)
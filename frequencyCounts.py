@@ -0,0 +1,173 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from compositeStore import COMPOSITE_DIR, CompositeStore, fill_year, gap_fill_plan, gap_filled_store
+from floodClassification import (FILLED_DIR, GAP_POLICY, PERENNIAL_THRESHOLD, ROW_CHUNK, SELECTED_BIWEEK,
+                                 SELECTED_YEAR, THRESHOLD, WEEK_FREQ, YEAR_FREQ, base_from_frequency,
+                                 classify_from_frequencies, flood_mask, ratio, water_and_valid, write_geotiff)
+from instrumentation import span, traced
+from s1Ingest import STORE_DIR as INGEST_DIR, biweek_mean, ingest_scenes, load_index
+
+# === CONFIGURATION ===
+COUNTS_DIR = "frequency_counts"
+COUNTS_INDEX = "counts.json"
+FLOOD_OUTPUT = "flood_raster_current.tif"
+
+# Running per-pixel counts behind every frequency in the classification, for one VV
+# threshold:
+#   water_year / valid_year     (year, row, col)    -> waterFreqThisYear
+#   water_biweek / valid_biweek (biweek, row, col)  -> waterFreqThisBiWeek
+#   water_all / valid_all       (row, col)          -> classifyPerennialAndNonWater
+# A changed composite moves each of them by (new - old) of its own water / valid
+# masks, so a new scene costs one bi-week mean and a few plane additions.
+COUNT_NAMES = ["water_year", "valid_year", "water_biweek", "valid_biweek", "water_all", "valid_all"]
+
+
+class FrequencyCounts:
+    def __init__(self, counts_dir=COUNTS_DIR, mode="r"):
+        self.counts_dir = counts_dir
+        with open(os.path.join(counts_dir, COUNTS_INDEX), "r") as f:
+            self.index = json.load(f)
+        self.threshold = self.index["threshold"]
+        self.years = self.index["years"]
+        for name in COUNT_NAMES:
+            setattr(self, name, np.load(os.path.join(counts_dir, name + ".npy"), mmap_mode=mode))
+
+    def archive_frequency(self):
+        return ratio(self.water_all.astype(np.float32), self.valid_all.astype(np.float32))
+
+    def year_frequency(self, year):
+        yi = self.years.index(year)
+        return ratio(self.water_year[yi].astype(np.float32), self.valid_year[yi].astype(np.float32))
+
+    def biweek_frequency(self, biweek):
+        return ratio(self.water_biweek[biweek].astype(np.float32), self.valid_biweek[biweek].astype(np.float32))
+
+    def base(self, perennial_threshold=PERENNIAL_THRESHOLD):
+        return base_from_frequency(self.archive_frequency(), perennial_threshold)
+
+    # Same result as classify_period on the store the counts were built from
+    def classify(self, composite, year, biweek, year_freq=YEAR_FREQ, week_freq=WEEK_FREQ,
+                 perennial_threshold=PERENNIAL_THRESHOLD):
+        water_now, valid_now = water_and_valid(composite, self.threshold)
+        return classify_from_frequencies(self.base(perennial_threshold), water_now, valid_now,
+                                         self.year_frequency(year), self.biweek_frequency(biweek),
+                                         year_freq, week_freq)
+
+    # Move every count by the difference between an old and a new composite at (yi, biweek)
+    def apply_delta(self, yi, biweek, old, new):
+        old_water, old_valid = water_and_valid(old, self.threshold)
+        new_water, new_valid = water_and_valid(new, self.threshold)
+        d_water = new_water.astype(np.int16) - old_water
+        d_valid = new_valid.astype(np.int16) - old_valid
+        for water, valid in ((self.water_year[yi], self.valid_year[yi]),
+                             (self.water_biweek[biweek], self.valid_biweek[biweek]),
+                             (self.water_all, self.valid_all)):
+            water += d_water.astype(water.dtype)  # negative deltas wrap back modulo 2**16
+            valid += d_valid.astype(valid.dtype)
+
+    def flush(self):
+        for name in COUNT_NAMES:
+            getattr(self, name).flush()
+
+
+@traced("build_counts")
+def build_counts(store, counts_dir=COUNTS_DIR, threshold=THRESHOLD, row_chunk=ROW_CHUNK):
+    os.makedirs(counts_dir, exist_ok=True)
+    n_years, n_biweeks, rows, cols = store.vv.shape
+    shapes = {"water_year": (n_years, rows, cols), "valid_year": (n_years, rows, cols),
+              "water_biweek": (n_biweeks, rows, cols), "valid_biweek": (n_biweeks, rows, cols),
+              "water_all": (rows, cols), "valid_all": (rows, cols)}
+    out = {name: np.lib.format.open_memmap(os.path.join(counts_dir, name + ".npy"), mode="w+",
+                                           dtype=np.uint16, shape=shape) for name, shape in shapes.items()}
+
+    for r0 in range(0, rows, row_chunk):
+        r1 = min(r0 + row_chunk, rows)
+        water, valid = water_and_valid(store.vv[:, :, r0:r1], threshold)
+        out["water_year"][:, r0:r1] = water.sum(axis=1)
+        out["valid_year"][:, r0:r1] = valid.sum(axis=1)
+        out["water_biweek"][:, r0:r1] = water.sum(axis=0)
+        out["valid_biweek"][:, r0:r1] = valid.sum(axis=0)
+        out["water_all"][r0:r1] = water.sum(axis=(0, 1))
+        out["valid_all"][r0:r1] = valid.sum(axis=(0, 1))
+
+    for array in out.values():
+        array.flush()
+    index_path = os.path.join(counts_dir, COUNTS_INDEX)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"threshold": threshold, "years": store.years, "grid": store.grid}, f)
+    os.replace(index_path + ".tmp", index_path)
+    return FrequencyCounts(counts_dir, mode="r+")
+
+
+# === New scenes: grid them, recomposite only their bi-weeks, update counts by delta ===
+@traced("incremental_update")
+def add_scenes(scene_paths, raw, counts, filled=None, policy=GAP_POLICY, ingest_dir=INGEST_DIR):
+    before = {s["scene"] for s in load_index(ingest_dir)["scenes"]}
+    index = ingest_scenes(scene_paths, raw.grid, ingest_dir)
+    touched = sorted({(s["year"], s["biweek"]) for s in index["scenes"]
+                      if s["scene"] not in before and s["year"] in raw.years})
+
+    changed = []
+    for year, biweek in touched:
+        yi = raw.year_index(year)
+        with span("recomposite", items=1):
+            mean = biweek_mean(ingest_dir, index, year, biweek)
+        if policy == "masked":
+            counts.apply_delta(yi, biweek, np.array(raw.vv[yi, biweek]), mean)
+        raw.vv[yi, biweek] = mean
+        raw.has_data[yi, biweek] = True
+        changed.append((year, biweek))
+
+    # With a filling policy a new bi-week can change the filled neighbours of that
+    # year as well: refill the year and take deltas of the slots that moved
+    if policy != "masked":
+        for year in sorted({y for y, _ in changed}):
+            yi = raw.year_index(year)
+            lo, hi, weight = gap_fill_plan(raw.has_data[yi], policy)
+            refilled = fill_year(raw.vv[yi], lo, hi, weight, np.empty(raw.vv.shape[1:], dtype=np.float32))
+            for biweek in range(raw.n_biweeks):
+                old = np.array(filled.vv[yi, biweek])
+                if not np.array_equal(old, refilled[biweek], equal_nan=True):
+                    counts.apply_delta(yi, biweek, old, refilled[biweek])
+                    filled.vv[yi, biweek] = refilled[biweek]
+            filled.has_data[yi] = raw.has_data[yi]
+        filled.vv.flush()
+        filled.save_index()
+
+    raw.vv.flush()
+    raw.save_index()
+    counts.flush()
+    return changed
+
+
+def current_store(raw, policy=GAP_POLICY, filled_dir=FILLED_DIR):
+    if policy == "masked":
+        return raw
+    return CompositeStore(filled_dir, mode="r+")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        store = gap_filled_store(CompositeStore(COMPOSITE_DIR), GAP_POLICY, FILLED_DIR)
+        counts = build_counts(store)
+        print(f"Counts for {len(counts.years)} years saved in: {COUNTS_DIR}")
+    elif command == "update":
+        start = time.perf_counter()
+        raw = CompositeStore(COMPOSITE_DIR, mode="r+")
+        counts = FrequencyCounts(COUNTS_DIR, mode="r+")
+        store = current_store(raw)
+        changed = add_scenes(sys.argv[2:], raw, counts, None if store is raw else store)
+        print(f"Updated bi-weeks: {changed}")
+
+        classification = counts.classify(store.composite(SELECTED_YEAR, SELECTED_BIWEEK),
+                                         SELECTED_YEAR, SELECTED_BIWEEK)
+        write_geotiff(FLOOD_OUTPUT, flood_mask(classification, store.grid), store.grid)
+        print(f"Flood map refreshed in {time.perf_counter() - start:.1f}s: {FLOOD_OUTPUT}")
+    else:
+        print("Usage: python frequencyCounts.py build | update <scene.tif> ...")
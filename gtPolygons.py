@@ -0,0 +1,169 @@
+import re
+import sys
+
+import numpy as np
+from osgeo import ogr, osr
+
+from instrumentation import span
+
+# === CONFIGURATION ===
+POLYGON_FILE = "gt_polygons.geojson"   # anything OGR opens: GeoJSON, Shapefile, GeoPackage
+NAME_FIELD = "Name"
+EARTH_RADIUS = 6378137.0               # sphere used by ee.Geometry.area
+
+# Two naming schemes are in use:
+#   <id><W|NW><DD><MM><YYYY>   e.g. 19W19102022   (CollectDataWithSampling.js)
+#   <id><W|NW><MM>/<YY>        e.g. 1W03/22       (dataCollection.js)
+# All names are joined into one string and matched with a single multiline regex,
+# so parsing is one pass in the regex engine; a name that matches neither scheme
+# gets no match and is flagged malformed.
+FORMAT_MALFORMED, FORMAT_DATED, FORMAT_MONTHLY = 0, 1, 2
+NAME_REGEX = re.compile(
+    r"^(?P<id>\d+)(?P<type>NW|W)"
+    r"(?:(?P<day>\d{2})(?P<month>\d{2})(?P<year>\d{4})|(?P<month2>\d{2})/(?P<year2>\d{2}))$",
+    re.MULTILINE)
+
+
+# === Step 1: Parse every name at once ===
+def parse_names(names):
+    n = len(names)
+    table = {
+        "name": np.array(names, dtype=str),
+        "id": np.full(n, -1, dtype=np.int32),
+        "id_text": np.full(n, "", dtype=object),   # id as written, leading zeros kept
+        "waterType": np.full(n, "", dtype="<U2"),
+        "day": np.zeros(n, dtype=np.int8),      # 0 for MM/YY names
+        "month": np.zeros(n, dtype=np.int8),
+        "year": np.zeros(n, dtype=np.int16),
+        "format": np.full(n, FORMAT_MALFORMED, dtype=np.int8),
+    }
+    if not n:
+        table["valid"] = np.zeros(0, dtype=bool)
+        return table
+
+    # Newlines inside a name would shift the row mapping; such names are malformed anyway
+    text = "\n".join(name.replace("\n", " ") for name in names)
+    line_starts = np.cumsum([0] + [len(name) + 1 for name in names[:-1]])
+    matches = list(NAME_REGEX.finditer(text))
+    if matches:
+        rows = np.searchsorted(line_starts, [m.start() for m in matches])
+        keys = ("id", "type", "day", "month", "year", "month2", "year2")
+        groups = np.array([[m.groupdict("")[k] for k in keys] for m in matches], dtype=str)
+        dated = groups[:, 2] != ""
+        table["id"][rows] = groups[:, 0].astype(np.int64)
+        table["id_text"][rows] = groups[:, 0]
+        table["waterType"][rows] = groups[:, 1]
+        table["format"][rows] = np.where(dated, FORMAT_DATED, FORMAT_MONTHLY)
+        table["day"][rows] = np.where(dated, groups[:, 2], "0").astype(np.int64)
+        table["month"][rows] = np.where(dated, groups[:, 3], groups[:, 5]).astype(np.int64)
+        table["year"][rows] = np.where(dated, groups[:, 4], np.char.add("20", groups[:, 6])).astype(np.int64)
+
+    # A well-formed name can still carry an impossible date (month 13, 31 Feb, 29 Feb 2023)
+    month_ok = (table["month"] >= 1) & (table["month"] <= 12)
+    month_start = ((table["year"].astype(np.int64) - 1970) * 12 + np.where(month_ok, table["month"], 1) - 1
+                   ).astype("datetime64[M]")
+    days_in_month = ((month_start + 1).astype("datetime64[D]") - month_start.astype("datetime64[D]")).astype(np.int64)
+    day_ok = (table["format"] == FORMAT_MONTHLY) | ((table["day"] >= 1) & (table["day"] <= days_in_month))
+    table["valid"] = (table["format"] != FORMAT_MALFORMED) & month_ok & day_ok
+    return table
+
+
+# === Step 2: Spherical polygon areas for all rings in one numpy pass ===
+# Flatten every ring to (lon, lat) vertices with an owner polygon and a sign (+1 shell,
+# -1 hole), then sum R^2 / 2 * (lon2 - lon1) * (2 + sin(lat1) + sin(lat2)) per ring.
+def ring_arrays(geometries):
+    coords, ring_owner, ring_sign, ring_len = [], [], [], []
+    for pid, geom in enumerate(geometries):
+        if geom is None:
+            continue
+        flat = ogr.ForceToMultiPolygon(geom.Clone())
+        for i in range(flat.GetGeometryCount()):
+            polygon = flat.GetGeometryRef(i)
+            for j in range(polygon.GetGeometryCount()):
+                points = polygon.GetGeometryRef(j).GetPoints() or []
+                if not points:
+                    continue  # an empty ring would break the vertex -> next-vertex wrap
+                coords.extend(p[:2] for p in points)
+                ring_owner.append(pid)
+                ring_sign.append(1.0 if j == 0 else -1.0)
+                ring_len.append(len(points))
+    return (np.array(coords, dtype=np.float64).reshape(-1, 2), np.array(ring_owner, dtype=np.int64),
+            np.array(ring_sign), np.array(ring_len, dtype=np.int64))
+
+
+def polygon_areas(geometries, radius=EARTH_RADIUS):
+    coords, ring_owner, ring_sign, ring_len = ring_arrays(geometries)
+    areas = np.zeros(len(geometries), dtype=np.float64)
+    if not len(ring_len):
+        return areas
+
+    lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    ring_of = np.repeat(np.arange(len(ring_len)), ring_len)
+    # Each vertex paired with the next one of its own ring (wrapping to the first)
+    starts = np.cumsum(ring_len) - ring_len
+    nxt = np.arange(len(lon)) + 1
+    nxt[starts + ring_len - 1] = starts
+    d_lon = lon[nxt] - lon
+    d_lon = (d_lon + np.pi) % (2 * np.pi) - np.pi  # across the antimeridian
+    terms = d_lon * (2 + np.sin(lat) + np.sin(lat[nxt]))
+    ring_area = np.abs(np.bincount(ring_of, weights=terms, minlength=len(ring_len))) * radius ** 2 / 2
+    return np.bincount(ring_owner, weights=ring_sign * ring_area, minlength=len(geometries))[:len(geometries)]
+
+
+# === Step 3: Load a GT polygon file into a columnar table ===
+def load_gt_polygons(path=POLYGON_FILE, name_field=NAME_FIELD):
+    with span("gt_load") as s:
+        ds = ogr.Open(path)
+        if ds is None:
+            raise FileNotFoundError(f"Cannot open {path}")
+        layer = ds.GetLayer()
+        wgs84 = osr.SpatialReference()
+        wgs84.ImportFromEPSG(4326)
+        wgs84.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        srs = layer.GetSpatialRef()
+        to_wgs84 = None
+        if srs is not None and not srs.IsSame(wgs84):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            to_wgs84 = osr.CoordinateTransformation(srs, wgs84)
+
+        names, geometries = [], []
+        for feat in layer:
+            geom = feat.GetGeometryRef()
+            geom = geom.Clone() if geom is not None else None
+            if geom is not None and to_wgs84 is not None:
+                geom.Transform(to_wgs84)
+            names.append(feat.GetField(name_field) or "")
+            geometries.append(geom)
+        s.add(items=len(names))
+
+    with span("gt_parse", items=len(names)):
+        table = parse_names(names)
+        table["geometry"] = np.array(geometries + [None], dtype=object)[:-1]  # 1-D even if all are None
+        table["poly_area_m2"] = polygon_areas(geometries)
+        table["valid"] &= np.array([g is not None for g in geometries], dtype=bool)
+    return table
+
+
+def select(table, mask):
+    return {key: column[mask] for key, column in table.items()}
+
+
+# Geometries + per-polygon attribute dicts, the shape negativeSampling.sample_nonwater_points takes
+def sampling_inputs(table):
+    attributes = [{"id": str(pid), "Name": str(name), "day": f"{day:02d}" if day else "", "month": f"{month:02d}",
+                   "year": str(year), "poly_area_m2": float(area)}
+                  for pid, name, day, month, year, area in zip(table["id_text"], table["name"], table["day"],
+                                                               table["month"], table["year"], table["poly_area_m2"])]
+    return list(table["geometry"]), attributes
+
+
+if __name__ == "__main__":
+    table = load_gt_polygons(sys.argv[1] if len(sys.argv) > 1 else POLYGON_FILE)
+    valid = table["valid"]
+    print(f"{len(valid)} polygons: {int((table['format'] == FORMAT_DATED).sum())} DDMMYYYY, "
+          f"{int((table['format'] == FORMAT_MONTHLY).sum())} MM/YY, {int((~valid).sum())} malformed")
+    for water_type in ("W", "NW"):
+        chosen = valid & (table["waterType"] == water_type)
+        print(f"  {water_type:2s}: {int(chosen.sum())} polygons, {table['poly_area_m2'][chosen].sum() / 1e6:.3f} km2")
+    for name in table["name"][~valid][:20]:
+        print(f"  malformed: {name!r}")
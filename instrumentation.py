@@ -0,0 +1,218 @@
+import atexit
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# === CONFIGURATION ===
+# Spans are recorded only when enabled, either with enable() or by setting
+# FLOOD_TRACE=<path>; with a path the trace is written there on exit
+# (.json -> Chrome trace, anything else -> JSON lines).
+TRACE_ENV = "FLOOD_TRACE"
+SAMPLE_INTERVAL = 0.005   # seconds between RSS samples while spans are open
+
+ENABLED = False
+_spans = []
+_open = set()
+_lock = threading.Lock()
+_sampler = None
+_t0 = time.perf_counter()
+
+
+# Without /proc (macOS) only the process's lifetime peak is available, so spans
+# there report that instead of their own peak; RSS_SOURCE says which one it is.
+RSS_SOURCE = "current" if os.path.exists("/proc/self/statm") else "process_peak"
+
+
+def process_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+def current_rss():
+    if RSS_SOURCE == "process_peak":
+        return process_peak_rss()
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# Background thread that raises the peak of every open span; it only runs while
+# instrumentation is enabled, so disabled spans never touch /proc.
+class _RSSSampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(SAMPLE_INTERVAL):
+            with _lock:
+                if not _open:
+                    continue
+                rss = current_rss()
+                for s in _open:
+                    if rss > s.peak_rss:
+                        s.peak_rss = rss
+
+
+class Span:
+    __slots__ = ("name", "attrs", "bytes", "items", "start", "end", "peak_rss", "tid")
+
+    def __init__(self, name, nbytes=0, items=0, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.bytes = nbytes
+        self.items = items
+        self.peak_rss = 0
+
+    def add(self, nbytes=0, items=0):
+        self.bytes += nbytes
+        self.items += items
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self.peak_rss = current_rss()
+        with _lock:
+            _open.add(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+        rss = current_rss()
+        with _lock:
+            _open.discard(self)
+            self.peak_rss = max(self.peak_rss, rss)
+            _spans.append(self)
+
+    @property
+    def seconds(self):
+        return self.end - self.start
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "start_s": round(self.start - _t0, 6),
+            "seconds": round(self.seconds, 6),
+            "bytes": self.bytes,
+            "items": self.items,
+            "peak_rss_mb": round(self.peak_rss / 1e6, 1),
+            "rss_source": RSS_SOURCE,
+            "thread": self.tid,
+            **self.attrs,
+        }
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def add(self, nbytes=0, items=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, nbytes=0, items=0, **attrs):
+    if not ENABLED:
+        return _NO_SPAN
+    return Span(name, nbytes, items, **attrs)
+
+
+def traced(name):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def enable():
+    global ENABLED, _sampler
+    ENABLED = True
+    if _sampler is None:
+        _sampler = _RSSSampler()
+        _sampler.start()
+
+
+def disable():
+    global ENABLED, _sampler
+    ENABLED = False
+    if _sampler is not None:
+        _sampler.stop.set()
+        _sampler = None
+
+
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+# === Summaries and exports ===
+def summary():
+    totals = {}
+    for s in spans():
+        t = totals.setdefault(s.name, {"count": 0, "seconds": 0.0, "bytes": 0, "items": 0, "peak_rss_mb": 0.0})
+        t["count"] += 1
+        t["seconds"] += s.seconds
+        t["bytes"] += s.bytes
+        t["items"] += s.items
+        t["peak_rss_mb"] = max(t["peak_rss_mb"], round(s.peak_rss / 1e6, 1))
+    return totals
+
+
+def print_summary():
+    if RSS_SOURCE == "process_peak":
+        print("  (no /proc: peak RSS is the process's lifetime peak, not per span)")
+    for name, t in sorted(summary().items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"  {name:<20} x{t['count']:<6} {t['seconds']:9.3f}s  {t['bytes'] / 1e6:9.1f} MB  "
+              f"{t['items']:>9} items  peak RSS {t['peak_rss_mb']:8.1f} MB")
+
+
+def export_jsonl(path):
+    with open(path, "w") as f:
+        for s in spans():
+            f.write(json.dumps(s.as_dict()) + "\n")
+
+
+def export_chrome_trace(path):
+    pid = os.getpid()
+    events = []
+    for s in spans():
+        d = s.as_dict()
+        events.append({
+            "name": s.name, "ph": "X", "pid": pid, "tid": s.tid,
+            "ts": round((s.start - _t0) * 1e6, 1), "dur": round(s.seconds * 1e6, 1),
+            "args": {k: v for k, v in d.items() if k not in ("name", "start_s", "seconds", "thread")},
+        })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def export(path):
+    if path.endswith(".json"):
+        export_chrome_trace(path)
+    else:
+        export_jsonl(path)
+
+
+if os.environ.get(TRACE_ENV):
+    enable()
+    atexit.register(export, os.environ[TRACE_ENV])
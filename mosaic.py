@@ -0,0 +1,301 @@
+import hashlib
+import io
+import os
+import numpy as np
+from osgeo import gdal, osr
+from glob import glob
+from PIL import Image
+
+from instrumentation import span
+
+# Tile-union logic behind the Merge script, importable by the benchmark and other stages.
+
+FLOOD_RGB = (0, 255, 255)  # cyan = flooded in the WMS flood layer
+
+# === Read georeferencing from the world file ===
+def get_georef_from_worldfile(wld_path, width, height):
+    with open(wld_path, 'r') as f:
+        px_size_x = float(f.readline())
+        _ = f.readline()  # skip
+        _ = f.readline()  # skip
+        px_size_y = -abs(float(f.readline()))  # Ensure north-up
+        x_min = float(f.readline())
+        y_max = float(f.readline())
+
+    transform = [x_min, px_size_x, 0, y_max, 0, px_size_y]
+    x_max = x_min + width * px_size_x
+    y_min = y_max + height * px_size_y
+    return transform, (x_min, y_min, x_max, y_max)
+
+# === Gather all tile PNGs and their world files ===
+def gather_tiles(tile_dir):
+    tile_paths = sorted(glob(os.path.join(tile_dir, "*.png")))
+    if not tile_paths:
+        raise FileNotFoundError("No tiles found in directory.")
+
+    transforms = []
+    bounds = []
+    with span("tile_scan", items=len(tile_paths)):
+        for tile in tile_paths:
+            wld = tile.replace(".png", ".wld")
+            img = Image.open(tile)
+            width, height = img.size
+            transform, extent = get_georef_from_worldfile(wld, width, height)
+            transforms.append((tile, transform))
+            bounds.append(extent)
+    return transforms, bounds
+
+# === Full output extent, at the pixel size of the finest tile ===
+def union_grid(transforms, bounds):
+    xmins, ymins, xmaxs, ymaxs = zip(*bounds)
+    x_min, y_min = min(xmins), min(ymins)
+    x_max, y_max = max(xmaxs), max(ymaxs)
+
+    px_w = min(t[1][1] for t in transforms)  # pixel width
+    px_h = -min(abs(t[1][5]) for t in transforms)  # pixel height (negative)
+
+    cols = int(round((x_max - x_min) / px_w))
+    rows = int(round((y_max - y_min) / abs(px_h)))
+    return x_min, y_max, px_w, px_h, rows, cols
+
+# === Overlapping tiles of different resolutions ===
+# Where tiles overlap, the finest one decides. Each output pixel remembers the level
+# (1 = coarsest) of the tiles that wrote it: a finer tile replaces whatever coarser
+# tiles left in its footprint, blank ones included (as zeros), and tiles of the same
+# level combine by max. The result doesn't depend on the order tiles are pasted in.
+def pixel_key(transform):
+    return float(f"{abs(transform[1] * transform[5]):.6g}")  # pixel area, float noise rounded off
+
+def resolution_levels(transforms):
+    sizes = sorted({pixel_key(t[1]) for t in transforms}, reverse=True)
+    return {size: i + 1 for i, size in enumerate(sizes)}
+
+# New values of an output window for a mask of the given level; updates its levels in place
+def merge_window(current, current_level, mask, level):
+    merged = np.where(current_level < level, mask,
+                      np.where(current_level == level, np.maximum(current, mask), current))
+    np.maximum(current_level, level, out=current_level)
+    return merged
+
+# Offset of a tile's top-left corner in the output raster (x_min, y_max = output origin).
+# Measured from the output origin to the tile and rounded, so tiles on the output
+# grid don't lose a pixel to float error.
+def raster_index(transform, x_min, y_max, px_w, px_h):
+    px = int(round((transform[0] - x_min) / px_w))
+    py = int(round((y_max - transform[3]) / abs(px_h)))
+    return px, py
+
+# === Flood mask of one tile: cyan pixels (or any non-zero grey) → 255 ===
+def tile_mask(img):
+    # Handle grayscale, RGB, RGBA
+    if img.ndim == 2:
+        return (img > 0).astype(np.uint8) * 255
+    elif img.ndim == 3 and img.shape[2] == 4:
+        # One compare per pixel on the packed RGBA word, alpha ignored
+        cyan = FLOOD_RGB[0] | FLOOD_RGB[1] << 8 | FLOOD_RGB[2] << 16
+        packed = np.ascontiguousarray(img).view("<u4")[:, :, 0]
+        return ((packed & 0x00FFFFFF) == cyan).astype(np.uint8) * 255
+    elif img.ndim == 3 and img.shape[2] >= 3:
+        return np.all(img[:, :, :3] == FLOOD_RGB, axis=-1).astype(np.uint8) * 255
+    return None
+
+# 256-entry index → mask table: palette entries that are cyan map to 255
+# A PNG's PLTE chunk is parsed by Image.open and kept raw on img.palette, so it can
+# be read without load(); getpalette() would decode the whole tile first
+def palette_lut(img):
+    if img.format == "PNG" and img.palette is not None and img.palette.rawmode:
+        stride = len(img.palette.rawmode)  # 3 bytes per entry, 4 for an RGBA palette
+        palette = np.frombuffer(bytes(img.palette.palette), dtype=np.uint8)
+    else:
+        stride, palette = 3, np.array(img.getpalette() or [], dtype=np.uint8)
+    palette = palette[:len(palette) // stride * stride].reshape(-1, stride)[:256, :3]
+    lut = np.zeros(256, dtype=np.uint8)
+    lut[:len(palette)][np.all(palette == FLOOD_RGB, axis=-1)] = 255
+    return lut
+
+# Blank tiles from a WMS are byte-identical, so once one has decoded to an empty
+# mask, later tiles of the same size and digest are skipped without decoding.
+class BlankTiles:
+    def __init__(self):
+        self.digests = {}  # byte size -> set of sha1 digests
+
+    def seen(self, data):
+        return len(data) in self.digests and hashlib.sha1(data).digest() in self.digests[len(data)]
+
+    def add(self, data):
+        self.digests.setdefault(len(data), set()).add(hashlib.sha1(data).digest())
+
+# Returns the tile's mask, or None when there is nothing to paste
+def decode_tile_bytes(data, blank_tiles=None, name=""):
+    if blank_tiles is not None and blank_tiles.seen(data):
+        return None
+
+    img = Image.open(io.BytesIO(data))  # parses the header chunks (PLTE included), no pixel data yet
+    if img.mode == "P":
+        # Palette tiles: no cyan entry means no flood, and the pixel data is never decoded
+        lut = palette_lut(img)
+        if not lut.any():
+            return None
+        mask = lut[np.asarray(img)]
+    else:
+        arr = np.asarray(img)
+        mask = tile_mask(arr)
+        if mask is None:
+            print(f"⚠️ Unsupported image shape: {arr.shape} for {name}")
+            return None
+
+    if not mask.any():
+        if blank_tiles is not None:
+            blank_tiles.add(data)
+        return None
+    return mask
+
+def decode_tile_mask(tile_path, blank_tiles=None):
+    with open(tile_path, "rb") as f:
+        return decode_tile_bytes(f.read(), blank_tiles, tile_path)
+
+# Overlap of a tile placed at (x_offset, y_offset) with a rows x cols raster:
+# (output slices, tile slices), or None when they don't overlap
+def clip_window(rows, cols, tile_rows, tile_cols, x_offset, y_offset):
+    y_start = max(0, y_offset)
+    x_start = max(0, x_offset)
+    y_end = min(rows, y_offset + tile_rows)
+    x_end = min(cols, x_offset + tile_cols)
+    if y_end <= y_start or x_end <= x_start:
+        return None
+
+    mask_y_start = max(0, -y_offset)
+    mask_x_start = max(0, -x_offset)
+    return ((slice(y_start, y_end), slice(x_start, x_end)),
+            (slice(mask_y_start, mask_y_start + (y_end - y_start)),
+             slice(mask_x_start, mask_x_start + (x_end - x_start))))
+
+# Nearest-neighbour upsampling of a coarser tile's mask onto the output pixel size
+def fit_to_grid(mask, transform, px_w, px_h):
+    scale_x, scale_y = transform[1] / px_w, transform[5] / px_h
+    if abs(scale_x - 1) < 1e-6 and abs(scale_y - 1) < 1e-6:
+        return mask
+    rows = int(round(mask.shape[0] * scale_y))
+    cols = int(round(mask.shape[1] * scale_x))
+    r = np.minimum(((np.arange(rows) + 0.5) / scale_y).astype(np.intp), mask.shape[0] - 1)
+    c = np.minimum(((np.arange(cols) + 0.5) / scale_x).astype(np.intp), mask.shape[1] - 1)
+    return mask[r[:, None], c]
+
+# === Paste a tile's mask into the union (pixel-wise max, or by level when levels is given) ===
+def paste_mask(flood_union, mask, transform, x_min, y_max, px_w, px_h, tile_path="", verbose=True,
+               levels=None, level=1):
+    rows, cols = flood_union.shape
+    mask = fit_to_grid(mask, transform, px_w, px_h)
+    tile_rows, tile_cols = mask.shape
+    x_offset, y_offset = raster_index(transform, x_min, y_max, px_w, px_h)
+
+    if verbose:
+        print(f"\n🧩 Processing tile: {tile_path}")
+        print(f"  Tile size: {tile_rows} rows x {tile_cols} cols")
+        print(f"  GeoTransform: {transform}")
+        print(f"  Offset in output raster: x={x_offset}, y={y_offset}")
+
+    window = clip_window(rows, cols, tile_rows, tile_cols, x_offset, y_offset)
+    if window is not None:
+        dst, src = window
+        with span("paste", nbytes=mask[src].size, items=1):
+            if levels is None:
+                flood_union[dst] = np.maximum(flood_union[dst], mask[src])
+            else:
+                flood_union[dst] = merge_window(flood_union[dst], levels[dst], mask[src], level)
+        return True
+
+    print(f" Skipped tile {tile_path}: slice out of bounds")
+    print(f"  Mask size: {tile_rows}x{tile_cols}, offsets: y={y_offset}, x={x_offset}")
+    return False
+
+# === Save as GeoTIFF ===
+def create_union(output_path, rows, cols, x_min, y_max, px_w, px_h, options=()):
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = driver.Create(output_path, cols, rows, 1, gdal.GDT_Byte, list(options))
+    out_ds.SetGeoTransform([x_min, px_w, 0, y_max, 0, px_h])
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)  # WGS84
+    out_ds.SetProjection(srs.ExportToWkt())
+    return out_ds
+
+def write_union(output_path, flood_union, x_min, y_max, px_w, px_h):
+    rows, cols = flood_union.shape
+    with span("write", nbytes=flood_union.nbytes, items=1):
+        out_ds = create_union(output_path, rows, cols, x_min, y_max, px_w, px_h)
+        out_ds.GetRasterBand(1).WriteArray(flood_union)
+        out_ds.GetRasterBand(1).SetNoDataValue(0)
+        out_ds.FlushCache()
+        out_ds = None
+
+# Union written window by window straight into a tiled GeoTIFF, so the full
+# raster never has to sit in memory. Each paste reads the tile's window back and
+# takes the max; a single thread must own the writer. With more than one
+# resolution level the per-pixel levels go to a sparse side file, removed on close.
+class UnionWriter:
+    def __init__(self, output_path, rows, cols, x_min, y_max, px_w, px_h, n_levels=1):
+        self.rows, self.cols = rows, cols
+        self.origin = (x_min, y_max, px_w, px_h)
+        options = ["TILED=YES", "BIGTIFF=IF_SAFER", "SPARSE_OK=TRUE"]
+        self.ds = create_union(output_path, rows, cols, x_min, y_max, px_w, px_h, options)
+        self.band = self.ds.GetRasterBand(1)
+        self.band.SetNoDataValue(0)
+        self.levels_path = self.levels_ds = self.levels = None
+        if n_levels > 1:
+            self.levels_path = output_path + ".levels.tif"
+            self.levels_ds = create_union(self.levels_path, rows, cols, x_min, y_max, px_w, px_h, options)
+            self.levels = self.levels_ds.GetRasterBand(1)
+
+    def paste(self, mask, transform, level=1):
+        mask = fit_to_grid(mask, transform, self.origin[2], self.origin[3])
+        x_offset, y_offset = raster_index(transform, *self.origin)
+        window = clip_window(self.rows, self.cols, mask.shape[0], mask.shape[1], x_offset, y_offset)
+        if window is None:
+            return False
+        (ys, xs), src = window
+        with span("paste", nbytes=mask[src].size, items=1):
+            current = self.band.ReadAsArray(xs.start, ys.start, xs.stop - xs.start, ys.stop - ys.start)
+            if self.levels is None:
+                self.band.WriteArray(np.maximum(current, mask[src]), xs.start, ys.start)
+            else:
+                current_level = self.levels.ReadAsArray(xs.start, ys.start, xs.stop - xs.start, ys.stop - ys.start)
+                self.band.WriteArray(merge_window(current, current_level, mask[src], level), xs.start, ys.start)
+                self.levels.WriteArray(current_level, xs.start, ys.start)
+        return True
+
+    def close(self):
+        with span("write", items=1):
+            self.ds.FlushCache()
+            self.band = None
+            self.ds = None
+            if self.levels_ds is not None:
+                self.levels = self.levels_ds = None
+                gdal.GetDriverByName("GTiff").Delete(self.levels_path)
+
+def merge_tiles(tile_dir, output_path, verbose=True):
+    transforms, bounds = gather_tiles(tile_dir)
+    x_min, y_max, px_w, px_h, rows, cols = union_grid(transforms, bounds)
+
+    flood_union = np.zeros((rows, cols), dtype=np.uint8)
+    level_of = resolution_levels(transforms)
+    levels = np.zeros((rows, cols), dtype=np.uint8) if len(level_of) > 1 else None
+    blank_tiles = BlankTiles()
+    skipped = 0
+    for (tile_path, transform), (t_xmin, t_ymin, t_xmax, t_ymax) in zip(transforms, bounds):
+        with span("decode", nbytes=os.path.getsize(tile_path), items=1):
+            mask = decode_tile_mask(tile_path, blank_tiles)
+        level = level_of[pixel_key(transform)]
+        if mask is None:
+            skipped += 1
+            if levels is None or level == 1:
+                continue
+            # A blank finer tile still clears what coarser tiles left in its footprint
+            mask = np.zeros((int(round((t_ymax - t_ymin) / abs(transform[5]))),
+                             int(round((t_xmax - t_xmin) / transform[1]))), dtype=np.uint8)
+        paste_mask(flood_union, mask, transform, x_min, y_max, px_w, px_h, tile_path, verbose, levels, level)
+
+    if verbose and skipped:
+        print(f"\nSkipped {skipped} blank tiles")
+    write_union(output_path, flood_union, x_min, y_max, px_w, px_h)
+    return flood_union
@@ -0,0 +1,165 @@
+import hashlib
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+
+import numpy as np
+from osgeo import gdal
+from scipy import ndimage
+
+from compositeStore import build_composite_store, gap_filled_store
+from floodClassification import (FLOOD, GAP_POLICY, PERENNIAL_THRESHOLD, SEASONAL, SELECTED_BIWEEK, SELECTED_YEAR,
+                                 SMUDGE_RADIUS_M, THRESHOLD, disk_kernel, pixel_size_m)
+from floodCodes import FloodCodes, build_codes
+from instrumentation import span
+from rocMetrics import confusion_counts, print_roc_report, roc_result, write_roc_csv
+from s1Ingest import SCENE_DIR, ingest_scenes
+from thresholdSweep import PARAM_GRID
+
+# === CONFIGURATION ===
+GT_RASTERS = sorted(glob(os.path.join("gt_regions", "*.tif")))   # one ground-truth raster per AOI
+SHARED_DIR = "shared_aoi"           # S1 grid, composites and codes over the union footprint
+WORKERS = os.cpu_count()
+
+# Every AOI is warped onto one pixel lattice (projection, resolution and origin of the
+# first GT), so the union footprint is a plain grid and each AOI is an
+# integer window into it. S1 scenes are warped, composited and encoded once for the
+# union; per-AOI work is a window read, a LUT gather and a smudge.
+
+
+# === Step 1: Align every GT to the shared lattice ===
+# Snaps bounds outwards to whole pixels of a lattice with origin (x0, y0); the small
+# tolerance keeps float noise from adding a pixel on an already-aligned edge
+def snap_bounds(bounds, x0, y0, px_w, px_h):
+    x_min, y_min, x_max, y_max = bounds
+    c0 = math.floor(round((x_min - x0) / px_w, 6))
+    c1 = math.ceil(round((x_max - x0) / px_w, 6))
+    r0 = math.floor(round((y0 - y_max) / px_h, 6))
+    r1 = math.ceil(round((y0 - y_min) / px_h, 6))
+    return x0 + c0 * px_w, y0 - r1 * px_h, x0 + c1 * px_w, y0 - r0 * px_h
+
+
+def aligned_gt(path, reference):
+    x0, px_w, _, y0, _, px_h = reference["transform"]
+    px_h = abs(px_h)
+    # targetAlignedPixels would snap to multiples of the resolution from 0, not to the
+    # reference GT's origin; a VRT warp gives the extent in the reference CRS for free
+    extent = gdal.Warp("", path, format="VRT", dstSRS=reference["projection"], xRes=px_w, yRes=px_h)
+    ex0, ex_w, _, ey0, _, ex_h = extent.GetGeoTransform()
+    bounds = (ex0, ey0 + extent.RasterYSize * ex_h, ex0 + extent.RasterXSize * ex_w, ey0)
+    extent = None
+    ds = gdal.Warp("", path, format="MEM", dstSRS=reference["projection"], xRes=px_w, yRes=px_h,
+                   outputBounds=snap_bounds(bounds, x0, y0, px_w, px_h), resampleAlg="near")
+    grid = {"projection": ds.GetProjection(), "transform": list(ds.GetGeoTransform()),
+            "rows": ds.RasterYSize, "cols": ds.RasterXSize}
+    return ds.GetRasterBand(1).ReadAsArray(), grid
+
+
+def reference_grid(path):
+    ds = gdal.Open(path)
+    return {"projection": ds.GetProjection(), "transform": list(ds.GetGeoTransform())}
+
+
+def union_grid(grids):
+    px_w, px_h = grids[0]["transform"][1], grids[0]["transform"][5]
+    x_min = min(g["transform"][0] for g in grids)
+    y_max = max(g["transform"][3] for g in grids)
+    x_max = max(g["transform"][0] + g["cols"] * px_w for g in grids)
+    y_min = min(g["transform"][3] + g["rows"] * px_h for g in grids)
+    return {"projection": grids[0]["projection"],
+            "transform": [x_min, px_w, 0, y_max, 0, px_h],
+            "rows": int(round((y_max - y_min) / abs(px_h))),
+            "cols": int(round((x_max - x_min) / px_w))}
+
+
+# (r0, r1, c0, c1) of an aligned AOI grid inside the union grid
+def aoi_window(grid, union):
+    c0 = int(round((grid["transform"][0] - union["transform"][0]) / union["transform"][1]))
+    r0 = int(round((grid["transform"][3] - union["transform"][3]) / union["transform"][5]))
+    return r0, r0 + grid["rows"], c0, c0 + grid["cols"]
+
+
+# === Step 2: Shared preprocessing over the union footprint ===
+def grid_key(grid):
+    return hashlib.sha1(json.dumps(grid, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def build_shared(union, scene_paths, shared_dir=SHARED_DIR, threshold=THRESHOLD,
+                 perennial_threshold=PERENNIAL_THRESHOLD):
+    # Adding an AOI can grow the union grid; everything built on it lives under a
+    # directory keyed by the grid, so a new grid starts fresh instead of failing
+    grid_dir = os.path.join(shared_dir, f"grid_{grid_key(union)}")
+    gridded_dir = os.path.join(grid_dir, "s1_gridded")
+    ingest_scenes(scene_paths, union, gridded_dir)  # cached per scene; reruns only add new scenes
+    store = build_composite_store(gridded_dir, os.path.join(grid_dir, "s1_composites"))
+    store = gap_filled_store(store, GAP_POLICY, os.path.join(grid_dir, "s1_composites_filled"))
+    codes_file = os.path.join(grid_dir, "flood_codes.npy")
+    index_file = os.path.join(grid_dir, "flood_codes.json")
+    build_codes(store, codes_file, index_file, threshold=threshold, perennial_threshold=perennial_threshold)
+    return codes_file, index_file
+
+
+# === Step 3: Evaluate one AOI as a window (runs in worker processes) ===
+def evaluate_aoi(job):
+    name, gt, window, codes_file, index_file, year, biweek, grid, radius_m = job
+    codes = FloodCodes(codes_file, index_file)
+    kernel = disk_kernel(radius_m, *pixel_size_m(codes.grid))
+    halo_r, halo_c = kernel.shape[0] // 2, kernel.shape[1] // 2
+
+    # Read the window plus a smudge-radius halo so focal_max matches a full-raster run
+    r0, r1, c0, c1 = window
+    rows, cols = codes.codes.shape[2:]
+    lo_r, hi_r = max(r0 - halo_r, 0), min(r1 + halo_r, rows)
+    lo_c, hi_c = max(c0 - halo_c, 0), min(c1 + halo_c, cols)
+    period = np.asarray(codes.period_codes(year, biweek, (lo_r, hi_r, lo_c, hi_c)))
+    keep = (slice(r0 - lo_r, r1 - lo_r), slice(c0 - lo_c, c1 - lo_c))
+
+    results = []
+    with span("aoi_eval", items=1):
+        for week_freq, year_freq in itertools.product(grid["weekFreq"], grid["yearFreq"]):
+            lut = codes.lut(year_freq, week_freq)
+            flood_lut = (lut == SEASONAL) | (lut == FLOOD)
+            mask = flood_lut[period]
+            if kernel.size > 1:
+                mask = ndimage.binary_dilation(mask, structure=kernel)
+            params = {"weekFreq": week_freq, "yearFreq": year_freq, "threshold": codes.index["threshold"],
+                      "perennialThreshold": codes.index["perennial_threshold"]}
+            results.append(dict(roc_result(params, *confusion_counts(mask[keep], gt)), aoi=name))
+    return name, results
+
+
+def run_aois(gt_paths=GT_RASTERS, scene_paths=None, shared_dir=SHARED_DIR, year=SELECTED_YEAR,
+             biweek=SELECTED_BIWEEK, grid=PARAM_GRID, workers=WORKERS):
+    if not gt_paths:
+        raise FileNotFoundError("No ground-truth rasters given.")
+    scene_paths = scene_paths if scene_paths is not None else sorted(glob(os.path.join(SCENE_DIR, "*.tif")))
+
+    reference = reference_grid(gt_paths[0])
+    aois = {}
+    for path in gt_paths:
+        gt, gt_grid = aligned_gt(path, reference)
+        aois[os.path.splitext(os.path.basename(path))[0]] = (gt, gt_grid)
+    union = union_grid([g for _, g in aois.values()])
+    area = sum(g["rows"] * g["cols"] for _, g in aois.values())
+    print(f"{len(aois)} AOIs, union grid {union['cols']} x {union['rows']} "
+          f"({100 * union['rows'] * union['cols'] / max(area, 1):.0f}% of the summed AOI pixels)")
+
+    codes_file, index_file = build_shared(union, scene_paths, shared_dir)
+
+    jobs = [(name, gt, aoi_window(gt_grid, union), codes_file, index_file, year, biweek, grid, SMUDGE_RADIUS_M)
+            for name, (gt, gt_grid) in aois.items()]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(evaluate_aoi, jobs))
+
+
+if __name__ == "__main__":
+    all_results = run_aois()
+    for name, results in sorted(all_results.items()):
+        print(f"\n=== AOI: {name} ===")
+        print_roc_report(results)
+        out_csv = os.path.join(SHARED_DIR, f"roc_results_{name}.csv")
+        write_roc_csv(out_csv, results)
+        print("ROC table saved to:", out_csv)
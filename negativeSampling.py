@@ -0,0 +1,188 @@
+import csv
+import numpy as np
+from osgeo import gdal, ogr, osr
+from scipy import ndimage
+
+from gtPolygons import FORMAT_DATED, load_gt_polygons, sampling_inputs, select
+
+# === CONFIGURATION ===
+POLYGON_FILE = "gt_polygons.geojson"
+OUTPUT_CSV = "nw_samples.csv"
+BUFFER_DIST = 30          # inner edge of the sampling ring (m), same as bufferDist in CollectDataWithSampling.js
+RING_WIDTH = 50           # outer edge = BUFFER_DIST + RING_WIDTH (m)
+SAMPLES_PER_POLY = 10     # N samples per polygon
+SCALE = 10                # sampling grid resolution (m)
+WINDOW_M = 5000           # polygons are sampled in windows of about this size, not one grid over all of them
+SEED = 0
+
+METERS_PER_DEGREE = 111320.0
+
+
+# === Step 1: Build a lon/lat grid at SCALE metres around all polygons ===
+def sampling_grid(geometries, pad_m, scale):
+    envelopes = np.array([g.GetEnvelope() for g in geometries])  # (xmin, xmax, ymin, ymax)
+    lat0 = (envelopes[:, 2].min() + envelopes[:, 3].max()) / 2
+    px_y = scale / METERS_PER_DEGREE
+    px_x = scale / (METERS_PER_DEGREE * np.cos(np.radians(lat0)))
+
+    pad_x = (pad_m + scale) / scale * px_x
+    pad_y = (pad_m + scale) / scale * px_y
+    x_min = envelopes[:, 0].min() - pad_x
+    y_max = envelopes[:, 3].max() + pad_y
+    cols = int(np.ceil((envelopes[:, 1].max() + pad_x - x_min) / px_x))
+    rows = int(np.ceil((y_max - (envelopes[:, 2].min() - pad_y)) / px_y))
+    return [x_min, px_x, 0, y_max, 0, -px_y], rows, cols
+
+
+# === Step 2: Burn every polygon's index (1..N) into one raster ===
+def rasterize_polygon_ids(geometries, transform, rows, cols):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    ds = gdal.GetDriverByName("MEM").Create("", cols, rows, 1, gdal.GDT_Int32)
+    ds.SetGeoTransform(transform)
+    ds.SetProjection(srs.ExportToWkt())
+
+    layer_ds = ogr.GetDriverByName("Memory").CreateDataSource("")
+    layer = layer_ds.CreateLayer("polys", srs, ogr.wkbUnknown)
+    layer.CreateField(ogr.FieldDefn("pid", ogr.OFTInteger))
+    for pid, geom in enumerate(geometries, start=1):
+        feat = ogr.Feature(layer.GetLayerDefn())
+        feat.SetField("pid", pid)
+        feat.SetGeometry(geom)
+        layer.CreateFeature(feat)
+
+    # ALL_TOUCHED keeps polygons smaller than a pixel; the ring edges move by at most one pixel
+    gdal.RasterizeLayer(ds, [1], layer, options=["ATTRIBUTE=pid", "ALL_TOUCHED=TRUE"])
+    return ds.GetRasterBand(1).ReadAsArray()
+
+
+# === Step 3: Assign every non-water pixel to its nearest polygon and its distance ring ===
+def ring_zones(poly_ids, transform, inner_m, outer_m):
+    px_x_m = transform[1] * METERS_PER_DEGREE * np.cos(np.radians(transform[3]))
+    px_y_m = abs(transform[5]) * METERS_PER_DEGREE
+
+    indices = np.empty((2,) + poly_ids.shape, dtype=np.int32)
+    dist = ndimage.distance_transform_edt(
+        poly_ids == 0, sampling=(px_y_m, px_x_m), return_indices=True, indices=indices
+    )
+    # EDT is centre-to-centre; half a pixel approximates the distance to the polygon edge
+    dist -= min(px_x_m, px_y_m) / 2
+    owner = poly_ids[indices[0], indices[1]]
+    del indices
+
+    outside = poly_ids == 0
+    ring = outside & (dist > inner_m) & (dist <= outer_m)
+    outer = outside & (dist <= outer_m)
+
+    # Same fallback as processPolygon: polygons with an empty ring sample the whole outer buffer
+    n_polys = int(poly_ids.max())
+    ring_counts = np.bincount(owner[ring], minlength=n_polys + 1)
+    empty_ring = ring_counts == 0
+    zone = ring | (outer & empty_ring[owner])
+    return zone, owner
+
+
+# === Step 4: Pick k random pixels per polygon in a single sort ===
+def sample_per_owner(zone, owner, k, rng):
+    candidates = np.flatnonzero(zone)
+    owners = owner.ravel()[candidates]
+    order = np.lexsort((rng.random(candidates.size), owners))
+    candidates, owners = candidates[order], owners[order]
+
+    group_start = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    group_len = np.diff(np.r_[group_start, owners.size])
+    rank = np.arange(owners.size) - np.repeat(group_start, group_len)
+    keep = rank < k
+    return candidates[keep], owners[keep]
+
+
+# === Step 5: Split polygons into passes and windows ===
+# Polygons whose outer-buffered envelopes overlap (e.g. the same water body on two
+# dates) go into different passes, so within a pass no burn overwrites another
+# polygon and every pixel within outer_m has exactly one owner: each polygon's ring
+# is its own, as with processPolygon. A pass is then cut into windows of about
+# WINDOW_M so the EDT grids stay small.
+def buffered_envelopes(geometries, pad_m):
+    env = np.array([g.GetEnvelope() for g in geometries])  # (xmin, xmax, ymin, ymax)
+    pad_y = pad_m / METERS_PER_DEGREE
+    pad_x = pad_m / (METERS_PER_DEGREE * np.cos(np.radians(np.maximum(np.abs(env[:, 2]), np.abs(env[:, 3])))))
+    return np.column_stack([env[:, 0] - pad_x, env[:, 1] + pad_x, env[:, 2] - pad_y, env[:, 3] + pad_y])
+
+
+def sampling_passes(boxes):
+    passes = np.full(len(boxes), -1)
+    for i, (xmin, xmax, ymin, ymax) in enumerate(boxes):
+        prev = boxes[:i]
+        hit = (prev[:, 0] <= xmax) & (prev[:, 1] >= xmin) & (prev[:, 2] <= ymax) & (prev[:, 3] >= ymin)
+        taken = set(passes[:i][hit].tolist())
+        passes[i] = next(p for p in range(len(taken) + 1) if p not in taken)
+    return passes
+
+
+def sampling_windows(boxes, window_m=WINDOW_M):
+    passes = sampling_passes(boxes)
+    lat0 = (boxes[:, 2].min() + boxes[:, 3].max()) / 2
+    cell_y = window_m / METERS_PER_DEGREE
+    cell_x = window_m / (METERS_PER_DEGREE * np.cos(np.radians(lat0)))
+    cx = np.floor((boxes[:, 0] + boxes[:, 1]) / 2 / cell_x).astype(np.int64)
+    cy = np.floor((boxes[:, 2] + boxes[:, 3]) / 2 / cell_y).astype(np.int64)
+    windows = {}
+    for i, key in enumerate(zip(passes.tolist(), cx.tolist(), cy.tolist())):
+        windows.setdefault(key, []).append(i)
+    return [windows[key] for key in sorted(windows)]
+
+
+def sample_window(geometries, samples_per_poly, inner_m, outer_m, scale, rng):
+    transform, rows, cols = sampling_grid(geometries, outer_m, scale)
+    poly_ids = rasterize_polygon_ids(geometries, transform, rows, cols)
+    zone, owner = ring_zones(poly_ids, transform, inner_m, outer_m)
+    flat_idx, pids = sample_per_owner(zone, owner, samples_per_poly, rng)
+
+    r, c = np.divmod(flat_idx, cols)
+    lon = transform[0] + (c + 0.5) * transform[1]
+    lat = transform[3] + (r + 0.5) * transform[5]
+    return lon, lat, pids - 1
+
+
+def sample_nonwater_points(geometries, attributes, samples_per_poly=SAMPLES_PER_POLY,
+                           buffer_dist=BUFFER_DIST, ring_width=RING_WIDTH, scale=SCALE, seed=SEED,
+                           window_m=WINDOW_M):
+    outer_m = buffer_dist + ring_width
+    rng = np.random.default_rng(seed)
+    windows = sampling_windows(buffered_envelopes(geometries, outer_m + 2 * scale), window_m)
+
+    points = []
+    for members in windows:
+        lon, lat, local = sample_window([geometries[i] for i in members], samples_per_poly,
+                                        buffer_dist, outer_m, scale, rng)
+        points.extend(zip(np.asarray(members)[local].tolist(), lon.tolist(), lat.tolist()))
+    points.sort(key=lambda p: p[0])  # grouped by polygon, as before
+
+    samples = []
+    for pid, x, y in points:
+        row = dict(attributes[pid])
+        row.update({"longitude": float(x), "latitude": float(y), "waterType": "NW"})
+        samples.append(row)
+    print(f"Sampled {len(geometries)} polygons in {len(windows)} windows")
+    return samples
+
+
+if __name__ == "__main__":
+    # === Load the water polygons (names like 19W19102022) ===
+    table = load_gt_polygons(POLYGON_FILE)
+    water = table["valid"] & (table["waterType"] == "W") & (table["format"] == FORMAT_DATED)
+    geometries, attributes = sampling_inputs(select(table, water))
+
+    print(f"Found {len(geometries)} water polygons")
+    samples = sample_nonwater_points(geometries, attributes)
+    print(f"New NW samples: {len(samples)}")
+
+    fields = ["id", "Name", "waterType", "day", "month", "year", "poly_area_m2", "latitude", "longitude"]
+    with open(OUTPUT_CSV, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(samples)
+
+    print(f"Done. Samples saved in: {OUTPUT_CSV}")
@@ -0,0 +1,214 @@
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from osgeo import gdal
+
+from instrumentation import span
+
+# === CONFIGURATION ===
+DATASET_CSV = "pixel_data_v2.csv"        # export of CollectDataWithSampling.js
+MODEL_PATH = "water_model.npz"
+S1_RASTER = "s1_vv_vh.tif"               # bands VV, VH in dB, as selected from COPERNICUS/S1_GRD
+S2_RASTER = "s2_bands.tif"               # bands B2, B3, B4, B8, B5, B6, B7, B8A, aligned with S1_RASTER
+OUTPUT_PATH = "learned_water_mask.tif"
+PROBABILITY_PATH = None                  # e.g. "learned_water_prob.tif" to also keep P(water)
+
+S1_BANDS = ["VV", "VH"]
+S2_BANDS = ["B2", "B3", "B4", "B8", "B5", "B6", "B7", "B8A"]
+FEATURES = S2_BANDS + S1_BANDS + ["NDWI", "VV_VH"]   # set to S1_BANDS + ["VV_VH"] for a radar-only model
+L2 = 1e-3
+VALIDATION_FRACTION = 0.2
+SEED = 0
+PROB_THRESHOLD = 0.5
+BLOCK_SIZE = 512
+WORKERS = os.cpu_count()
+NODATA = 255
+
+
+# === Features: raw bands plus a couple of indices, same code for CSV columns and raster blocks ===
+def feature_stack(bands, names=FEATURES):
+    features = []
+    for name in names:
+        if name == "NDWI":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                features.append((bands["B3"] - bands["B8"]) / (bands["B3"] + bands["B8"]))
+        elif name == "VV_VH":
+            features.append(bands["VV"] - bands["VH"])
+        else:
+            features.append(bands[name])
+    return np.stack(features).astype(np.float32)
+
+
+def required_bands(names=FEATURES):
+    needed = set(n for n in names if n in S1_BANDS + S2_BANDS)
+    if "NDWI" in names:
+        needed.update(["B3", "B8"])
+    if "VV_VH" in names:
+        needed.update(["VV", "VH"])
+    return needed
+
+
+# === Step 1: Load the labelled W / NW pixels ===
+def load_dataset(path=DATASET_CSV, names=FEATURES):
+    columns = {b: [] for b in required_bands(names)}
+    labels = []
+    with open(path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("sample_missing") in ("1", "true", "True"):
+                continue
+            try:
+                values = {b: float(row[b]) for b in columns}
+            except (KeyError, ValueError):
+                continue  # masked band -> empty cell in the GEE export
+            for b, v in values.items():
+                columns[b].append(v)
+            labels.append(1 if row["waterType"] == "W" else 0)
+
+    bands = {b: np.array(v, dtype=np.float32) for b, v in columns.items()}
+    x = feature_stack(bands, names).T
+    keep = np.isfinite(x).all(axis=1)
+    return x[keep], np.array(labels, dtype=np.float32)[keep]
+
+
+# === Step 2: L2-regularised logistic regression by Newton / IRLS (a handful of iterations) ===
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def fit_logistic(x, y, l2=L2, iterations=25, tol=1e-6):
+    mean = x.mean(axis=0)
+    std = x.std(axis=0)
+    std[std == 0] = 1
+    xs = np.column_stack([(x - mean) / std, np.ones(len(x))]).astype(np.float64)
+
+    w = np.zeros(xs.shape[1])
+    reg = np.full(xs.shape[1], l2 * len(x))
+    reg[-1] = 0  # no penalty on the bias
+    for _ in range(iterations):
+        p = sigmoid(xs @ w)
+        grad = xs.T @ (p - y) + reg * w
+        hess = (xs * (p * (1 - p))[:, None]).T @ xs + np.diag(reg)
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.abs(step).max() < tol:
+            break
+
+    # Fold the standardisation into the weights so inference is one dot product
+    weights = w[:-1] / std
+    bias = w[-1] - (mean * weights).sum()
+    return weights.astype(np.float32), np.float32(bias)
+
+
+def predict_proba(x, weights, bias):
+    return sigmoid(x @ weights + bias)
+
+
+def train(path=DATASET_CSV, model_path=MODEL_PATH, names=FEATURES, seed=SEED):
+    x, y = load_dataset(path, names)
+    print(f"Loaded {len(y)} pixels ({int(y.sum())} W / {int(len(y) - y.sum())} NW)")
+
+    order = np.random.default_rng(seed).permutation(len(y))
+    n_val = int(len(y) * VALIDATION_FRACTION)
+    val, fit = order[:n_val], order[n_val:]
+
+    with span("train", items=len(fit)):
+        weights, bias = fit_logistic(x[fit], y[fit])
+    if n_val:
+        pred = predict_proba(x[val], weights, bias) >= PROB_THRESHOLD
+        print(f"Validation accuracy: {(pred == (y[val] == 1)).mean():.4f} on {n_val} pixels")
+
+    np.savez(model_path, weights=weights, bias=bias, features=np.array(names))
+    print("Model saved to:", model_path)
+    return weights, bias
+
+
+# === Step 3: Block-wise inference over whole rasters (one open dataset set per worker) ===
+_worker = {}
+
+
+def _open_rasters(model_path, s1_path, s2_path):
+    model = np.load(model_path)
+    names = [str(n) for n in model["features"]]
+    needed = required_bands(names)
+    _worker["model"] = (model["weights"], model["bias"], names)
+    _worker["sources"] = []
+    for path, band_names in ((s1_path, S1_BANDS), (s2_path, S2_BANDS)):
+        if needed & set(band_names):
+            _worker["sources"].append((gdal.Open(path), band_names))
+
+
+def infer_block(window):
+    x0, y0, w, h = window
+    weights, bias, names = _worker["model"]
+    bands = {}
+    for ds, band_names in _worker["sources"]:
+        block = ds.ReadAsArray(x0, y0, w, h).astype(np.float32).reshape(len(band_names), h, w)
+        for name, values in zip(band_names, block):
+            nodata = ds.GetRasterBand(band_names.index(name) + 1).GetNoDataValue()
+            if nodata is not None:
+                values[values == nodata] = np.nan
+            bands[name] = values
+
+    x = feature_stack(bands, names).reshape(len(names), -1)
+    valid = np.isfinite(x).all(axis=0)
+    prob = np.full(x.shape[1], np.nan, dtype=np.float32)
+    prob[valid] = predict_proba(x[:, valid].T, weights, bias)
+    return window, prob.reshape(h, w)
+
+
+def block_windows(cols, rows, block_size=BLOCK_SIZE):
+    return [(x0, y0, min(block_size, cols - x0), min(block_size, rows - y0))
+            for y0 in range(0, rows, block_size) for x0 in range(0, cols, block_size)]
+
+
+def create_output(path, like, dtype, nodata):
+    out = gdal.GetDriverByName("GTiff").Create(
+        path, like.RasterXSize, like.RasterYSize, 1, dtype,
+        ["TILED=YES", f"BLOCKXSIZE={BLOCK_SIZE}", f"BLOCKYSIZE={BLOCK_SIZE}", "COMPRESS=DEFLATE"])
+    out.SetGeoTransform(like.GetGeoTransform())
+    out.SetProjection(like.GetProjection())
+    out.GetRasterBand(1).SetNoDataValue(nodata)
+    return out
+
+
+def predict_raster(model_path=MODEL_PATH, s1_path=S1_RASTER, s2_path=S2_RASTER, output_path=OUTPUT_PATH,
+                   probability_path=PROBABILITY_PATH, threshold=PROB_THRESHOLD, workers=WORKERS):
+    like = gdal.Open(s1_path)
+    windows = block_windows(like.RasterXSize, like.RasterYSize)
+    mask_ds = create_output(output_path, like, gdal.GDT_Byte, NODATA)
+    prob_ds = create_output(probability_path, like, gdal.GDT_Float32, np.nan) if probability_path else None
+
+    water = 0
+    with span("infer", items=len(windows)) as s, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_open_rasters,
+                                initargs=(model_path, s1_path, s2_path)) as pool:
+        # Blocks come back in order and are written as they arrive
+        for (x0, y0, w, h), prob in pool.map(infer_block, windows, chunksize=4):
+            mask = np.where(np.isfinite(prob), prob >= threshold, NODATA).astype(np.uint8)
+            mask_ds.GetRasterBand(1).WriteArray(mask, x0, y0)
+            if prob_ds is not None:
+                prob_ds.GetRasterBand(1).WriteArray(prob, x0, y0)
+            water += int((mask == 1).sum())
+            s.add(nbytes=prob.nbytes)
+
+    mask_ds.FlushCache()
+    mask_ds = None
+    if prob_ds is not None:
+        prob_ds.FlushCache()
+        prob_ds = None
+    print(f"Water pixels: {water}")
+    print("Learned water mask saved to:", output_path)
+    return water
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "train"
+    if command == "train":
+        train()
+    elif command == "predict":
+        predict_raster()
+    else:
+        print("Usage: python pixelClassifier.py [train|predict]")
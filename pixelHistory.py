@@ -0,0 +1,187 @@
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+from osgeo import osr
+
+from compositeStore import COMPOSITE_DIR, CompositeStore, gap_filled_store
+from floodClassification import BATCH_FLOOD, FILLED_DIR, GAP_POLICY, THRESHOLD, water_and_valid
+from instrumentation import span, traced
+
+# === CONFIGURATION ===
+HISTORY_DIR = "pixel_history"
+HISTORY_INDEX = "history.json"
+TILE = 64                       # pixels per tile side
+BUFFER_MB = 512                 # read buffer of the rechunking job
+POINTS_CSV = "nw_samples.csv"   # any CSV with latitude / longitude columns
+POINTS_OUTPUT = "pixel_histories.csv"
+
+# Time-major copy of the composite cube: vv.npy is (tile_row, tile_col, TILE, TILE, T)
+# with T = year * biweek innermost, so one pixel's full history is T contiguous
+# floats and a window touches one contiguous block per tile. flood.npy (uint8) is the
+# same rechunk of the batch flood masks, when those exist. Edge tiles are padded
+# with NaN / 0.
+
+
+class PixelHistory:
+    def __init__(self, history_dir=HISTORY_DIR):
+        with open(os.path.join(history_dir, HISTORY_INDEX), "r") as f:
+            self.index = json.load(f)
+        self.grid = self.index["grid"]
+        self.years = self.index["years"]
+        self.n_biweeks = self.index["n_biweeks"]
+        self.tile = self.index["tile"]
+        self.has_data = np.array(self.index["has_data"], dtype=bool).ravel()
+        self.time_start = np.array(self.index["time_start"], dtype=np.int64).ravel()
+        self.vv = np.load(os.path.join(history_dir, "vv.npy"), mmap_mode="r")
+        flood_path = os.path.join(history_dir, "flood.npy")
+        self.flood = np.load(flood_path, mmap_mode="r") if os.path.exists(flood_path) else None
+
+    def slot(self, t):
+        return self.years[t // self.n_biweeks], t % self.n_biweeks
+
+    def _gather(self, array, rows, cols):
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        out = np.empty((len(rows), array.shape[-1]), dtype=array.dtype)
+        # Sorted by tile so points sharing a tile are read together
+        order = np.lexsort((cols % self.tile, rows % self.tile, cols // self.tile, rows // self.tile))
+        with span("history_read", nbytes=out.nbytes, items=len(rows)):
+            for i in order:
+                out[i] = array[rows[i] // self.tile, cols[i] // self.tile, rows[i] % self.tile, cols[i] % self.tile]
+        return out
+
+    # (n, T) histories at pixel (row, col) positions
+    def points(self, rows, cols):
+        return self._gather(self.vv, rows, cols)
+
+    def flood_points(self, rows, cols):
+        return None if self.flood is None else self._gather(self.flood, rows, cols)
+
+    # (r1 - r0, c1 - c0, T) histories of a window
+    def window(self, r0, r1, c0, c1, array=None):
+        array = self.vv if array is None else array
+        t = self.tile
+        out = np.empty((r1 - r0, c1 - c0, array.shape[-1]), dtype=array.dtype)
+        with span("history_read", nbytes=out.nbytes, items=out.shape[0] * out.shape[1]):
+            for tr in range(r0 // t, (r1 - 1) // t + 1):
+                for tc in range(c0 // t, (c1 - 1) // t + 1):
+                    lo_r, hi_r = max(r0, tr * t), min(r1, (tr + 1) * t)
+                    lo_c, hi_c = max(c0, tc * t), min(c1, (tc + 1) * t)
+                    out[lo_r - r0:hi_r - r0, lo_c - c0:hi_c - c0] = \
+                        array[tr, tc, lo_r - tr * t:hi_r - tr * t, lo_c - tc * t:hi_c - tc * t]
+        return out
+
+    def water(self, histories, threshold=THRESHOLD):
+        return water_and_valid(histories, threshold)
+
+    # Grid pixel of lon / lat (WGS84) points; -1 where outside the grid
+    def pixel_of(self, lon, lat):
+        srs = osr.SpatialReference(wkt=self.grid["projection"])
+        if srs.IsGeographic():
+            x, y = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        else:
+            wgs84 = osr.SpatialReference()
+            wgs84.ImportFromEPSG(4326)
+            wgs84.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            xy = np.array(osr.CoordinateTransformation(wgs84, srs).TransformPoints(
+                np.column_stack([lon, lat]).tolist()))
+            x, y = xy[:, 0], xy[:, 1]
+        gt = self.grid["transform"]
+        cols = np.floor((x - gt[0]) / gt[1]).astype(np.int64)
+        rows = np.floor((y - gt[3]) / gt[5]).astype(np.int64)
+        outside = (rows < 0) | (rows >= self.grid["rows"]) | (cols < 0) | (cols >= self.grid["cols"])
+        return np.where(outside, -1, rows), np.where(outside, -1, cols)
+
+
+# === Out-of-core rechunk: slot-major (year, biweek, row, col) -> tile / time-major ===
+def rechunk(src, out_path, tile=TILE, fill=np.nan, buffer_mb=BUFFER_MB):
+    n_years, n_biweeks, rows, cols = src.shape
+    n_t = n_years * n_biweeks
+    n_tr, n_tc = (rows + tile - 1) // tile, (cols + tile - 1) // tile
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=src.dtype, shape=(n_tr, n_tc, tile, tile, n_t))
+
+    # A band of tile rows is read over as many columns as fit in the buffer: every
+    # slot contributes one run per row, then it is transposed in memory
+    band_cols = max(tile, (buffer_mb * 2 ** 20 // (n_t * tile * src.dtype.itemsize)) // tile * tile)
+    for tr in range(n_tr):
+        r0, r1 = tr * tile, min((tr + 1) * tile, rows)
+        for c0 in range(0, cols, band_cols):
+            c1 = min(c0 + band_cols, cols)
+            with span("rechunk", nbytes=n_t * (r1 - r0) * (c1 - c0) * src.dtype.itemsize, items=1):
+                block = np.asarray(src[:, :, r0:r1, c0:c1]).reshape(n_t, r1 - r0, c1 - c0)
+                block = np.ascontiguousarray(block.transpose(1, 2, 0))  # (row, col, T)
+                for tc in range(c0 // tile, (c1 + tile - 1) // tile):
+                    lo, hi = tc * tile - c0, min((tc + 1) * tile, c1) - c0
+                    out[tr, tc, :r1 - r0, :hi - lo] = block[:, lo:hi]
+                    out[tr, tc, r1 - r0:] = fill
+                    out[tr, tc, :, hi - lo:] = fill
+    out.flush()
+    return out
+
+
+@traced("build_history")
+def build_history(store, history_dir=HISTORY_DIR, flood_path=BATCH_FLOOD, tile=TILE):
+    os.makedirs(history_dir, exist_ok=True)
+    rechunk(store.vv, os.path.join(history_dir, "vv.npy"), tile)
+    if flood_path and os.path.exists(flood_path):
+        rechunk(np.load(flood_path, mmap_mode="r"), os.path.join(history_dir, "flood.npy"), tile, fill=0)
+
+    index_path = os.path.join(history_dir, HISTORY_INDEX)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"grid": store.grid, "years": store.years, "n_biweeks": store.n_biweeks, "tile": tile,
+                   "has_data": store.has_data.astype(int).tolist(), "time_start": store.time_start.tolist(),
+                   "source": store.store_dir, "gap_policy": store.index.get("gap_policy", "masked")}, f)
+    os.replace(index_path + ".tmp", index_path)
+    return PixelHistory(history_dir)
+
+
+# === Histories of CSV points (e.g. training samples) in long format ===
+def export_points(history, points_csv=POINTS_CSV, output_csv=POINTS_OUTPUT, threshold=THRESHOLD):
+    with open(points_csv, "r", newline="") as f:
+        points = list(csv.DictReader(f))
+    rows, cols = history.pixel_of([float(p["longitude"]) for p in points], [float(p["latitude"]) for p in points])
+    inside = np.flatnonzero(rows >= 0)
+    vv = history.points(rows[inside], cols[inside])
+    water, valid = history.water(vv, threshold)
+    flood = history.flood_points(rows[inside], cols[inside])
+
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["point", "latitude", "longitude", "year", "biweek", "vv", "valid", "water", "flood"])
+        for k, i in enumerate(inside):
+            for t in range(vv.shape[1]):
+                year, biweek = history.slot(t)
+                writer.writerow([i, points[i]["latitude"], points[i]["longitude"], year, biweek,
+                                 "" if not valid[k, t] else f"{vv[k, t]:.3f}", int(valid[k, t]),
+                                 int(water[k, t]), "" if flood is None else int(flood[k, t])])
+    print(f"{len(inside)} of {len(points)} points inside the grid")
+    return len(inside)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        store = gap_filled_store(CompositeStore(COMPOSITE_DIR), GAP_POLICY, FILLED_DIR)
+        history = build_history(store)
+        print(f"Pixel history {history.vv.shape} saved in: {HISTORY_DIR}")
+    elif command == "point":
+        history = PixelHistory()
+        rows, cols = history.pixel_of([float(sys.argv[2])], [float(sys.argv[3])])
+        if rows[0] < 0:
+            sys.exit("Point is outside the grid.")
+        vv = history.points(rows, cols)[0]
+        water, valid = history.water(vv)
+        flood = history.flood_points(rows, cols)
+        for t in range(len(vv)):
+            year, biweek = history.slot(t)
+            flag = "water" if water[t] else ("dry" if valid[t] else "-")
+            print(f"{year} biweek {biweek:2d}: {vv[t]:8.2f}  {flag}"
+                  + ("" if flood is None else f"  flood={flood[0, t]}"))
+    elif command == "points":
+        export_points(PixelHistory(), *sys.argv[2:4])
+        print("Histories saved to:", sys.argv[3] if len(sys.argv) > 3 else POINTS_OUTPUT)
+    else:
+        print("Usage: python pixelHistory.py build | point <lon> <lat> | points [points.csv] [out.csv]")
@@ -0,0 +1,188 @@
+import csv
+import numpy as np
+
+# ROC bookkeeping shared by the local sweeps (generateROCCurve in newCompareGT.js).
+# A result is a dict with the sweep parameters plus TP / FP / FN / TN / TPR / FPR.
+
+PARAM_NAMES = ["weekFreq", "yearFreq", "threshold", "perennialThreshold"]
+CSV_FIELDS = ["WeekFreq", "YearFreq", "Threshold", "PerennialThreshold", "TPR", "FPR", "TP", "FP", "FN", "TN"]
+BLOCK_SIZE = 256         # pixels per side of a bootstrap block (wider than the smudge and speckle scales)
+N_BOOT = 2000
+CI = 0.95
+BOOT_CHUNK = 250         # resamples per matrix product
+SEED = 0
+
+
+# === Confusion counts (calculateTPRandFPRFromRasters): both rasters unmask(0).gt(0) ===
+# NaN > 0 is False, the same as unmask(0).gt(0), so no float copy is needed; boolean
+# masks are used as they are
+def positive_mask(raster):
+    raster = np.asarray(raster)
+    return raster if raster.dtype == bool else np.greater(raster, 0)
+
+
+def confusion_counts(predicted, ground_truth):
+    pred = positive_mask(predicted)
+    gt = positive_mask(ground_truth)
+    tp = int(np.count_nonzero(pred & gt))
+    fp = int(np.count_nonzero(pred)) - tp
+    fn = int(np.count_nonzero(gt)) - tp
+    tn = pred.size - tp - fp - fn
+    return tp, fp, fn, tn
+
+
+# Same counts per BLOCK_SIZE x BLOCK_SIZE block, (n_blocks, 4) as TP, FP, FN, TN.
+# Each boolean product is padded to whole blocks and summed through a block reshape,
+# so the temporaries stay at one byte per pixel; pass boolean inputs to skip even the
+# comparison.
+def block_confusion_counts(predicted, ground_truth, block=BLOCK_SIZE):
+    pred = positive_mask(predicted)
+    gt = positive_mask(ground_truth)
+    rows, cols = pred.shape
+    n_br, n_bc = (rows + block - 1) // block, (cols + block - 1) // block
+    pad = ((0, n_br * block - rows), (0, n_bc * block - cols))
+
+    counts = np.empty((n_br * n_bc, 4), dtype=np.int32)
+    for k, product in enumerate((pred & gt, pred & ~gt, ~pred & gt)):
+        if pad[0][1] or pad[1][1]:
+            product = np.pad(product, pad)
+        counts[:, k] = product.reshape(n_br, block, n_bc, block).sum(axis=(1, 3), dtype=np.int32).ravel()
+    block_rows = np.minimum(block, rows - np.arange(n_br) * block)
+    block_cols = np.minimum(block, cols - np.arange(n_bc) * block)
+    counts[:, 3] = np.outer(block_rows, block_cols).ravel() - counts[:, :3].sum(axis=1)
+    return counts
+
+
+def rates(tp, fp, fn, tn):
+    tpr = tp / (tp + fn) if (tp + fn) > 0 else 0
+    fpr = fp / (fp + tn) if (fp + tn) > 0 else 0
+    return tpr, fpr
+
+
+def roc_result(params, tp, fp, fn, tn):
+    tpr, fpr = rates(tp, fp, fn, tn)
+    result = dict(params)
+    result.update({"TPR": tpr, "FPR": fpr, "TP": tp, "FP": fp, "FN": fn, "TN": tn})
+    return result
+
+
+# === Curve summaries ===
+def sort_by_fpr(results):
+    return sorted(results, key=lambda r: r["FPR"])
+
+
+def auc(results):
+    ordered = sort_by_fpr(results)
+    fpr = np.array([r["FPR"] for r in ordered])
+    tpr = np.array([r["TPR"] for r in ordered])
+    # Trapezoids between consecutive points, as in generateROCCurve (no (0,0)/(1,1) anchors)
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)) if len(ordered) > 1 else 0.0
+
+
+def youden(result):
+    return result["TPR"] - result["FPR"]
+
+
+def best_youden(results):
+    best = None
+    for r in results:
+        if best is None or youden(r) > youden(best):
+            best = r
+    return best
+
+
+# Points no other point beats on both axes (lower FPR and higher TPR)
+def pareto_front(results):
+    ordered = sorted(results, key=lambda r: (r["FPR"], -r["TPR"]))
+    front, best_tpr = [], -1.0
+    for r in ordered:
+        if r["TPR"] > best_tpr:
+            front.append(r)
+            best_tpr = r["TPR"]
+    return front
+
+
+# === Block bootstrap over recorded per-block counts ===
+# block_counts is (n_results, n_blocks, 4). A resample draws n_blocks blocks with
+# replacement, i.e. a multinomial weight per block, so every result's resampled
+# counts are one weighted sum and a chunk of resamples is a single matrix product.
+# Blocks keep the spatial autocorrelation inside them that a per-pixel bootstrap
+# would ignore.
+def bootstrap_roc(block_counts, n_boot=N_BOOT, ci=CI, seed=SEED, chunk=BOOT_CHUNK):
+    block_counts = np.asarray(block_counts, dtype=np.float64)  # exact totals (float32 stops at 2**24)
+    n_results, n_blocks = block_counts.shape[:2]
+    flat = block_counts.transpose(1, 0, 2).reshape(n_blocks, n_results * 4)
+    rng = np.random.default_rng(seed)
+
+    tpr = np.zeros((n_boot, n_results))
+    fpr = np.zeros((n_boot, n_results))
+    for b0 in range(0, n_boot, chunk):
+        b1 = min(b0 + chunk, n_boot)
+        weights = rng.multinomial(n_blocks, np.full(n_blocks, 1.0 / n_blocks), size=b1 - b0).astype(np.float64)
+        counts = (weights @ flat).reshape(b1 - b0, n_results, 4)
+        tp, fp, fn, tn = counts[..., 0], counts[..., 1], counts[..., 2], counts[..., 3]
+        np.divide(tp, tp + fn, out=tpr[b0:b1], where=tp + fn > 0)
+        np.divide(fp, fp + tn, out=fpr[b0:b1], where=fp + tn > 0)
+
+    # Same curve summaries as auc() / best_youden(), per resample
+    order = np.argsort(fpr, axis=1, kind="stable")
+    f, t = np.take_along_axis(fpr, order, axis=1), np.take_along_axis(tpr, order, axis=1)
+    aucs = np.sum(np.diff(f, axis=1) * (t[:, 1:] + t[:, :-1]) / 2, axis=1) if n_results > 1 else np.zeros(n_boot)
+    best = np.argmax(tpr - fpr, axis=1)
+
+    q = [(1 - ci) / 2, 1 - (1 - ci) / 2]
+    return {
+        "n_boot": n_boot, "n_blocks": n_blocks, "ci": ci,
+        "TPR": np.quantile(tpr, q, axis=0).T,          # (n_results, 2)
+        "FPR": np.quantile(fpr, q, axis=0).T,
+        "youden": np.quantile(tpr - fpr, q, axis=0).T,
+        "AUC": np.quantile(aucs, q),
+        "best_share": np.bincount(best, minlength=n_results) / n_boot,   # how often each result wins
+    }
+
+
+def print_bootstrap_report(results, boot, top=5):
+    pct = int(round(boot["ci"] * 100))
+    print(f"Block bootstrap: {boot['n_boot']} resamples of {boot['n_blocks']} blocks, {pct}% intervals")
+    print(f"AUC: {auc(results):.4f} [{boot['AUC'][0]:.4f}, {boot['AUC'][1]:.4f}]")
+    print("Most frequent best combinations (share of resamples):")
+    for i in np.argsort(-boot["best_share"], kind="stable")[:top]:
+        if boot["best_share"][i] == 0:
+            break
+        r = results[i]
+        print(f"  {boot['best_share'][i]:6.1%}  WeekFreq = {r.get('weekFreq')}, YearFreq = {r.get('yearFreq')}, "
+              f"Threshold = {r.get('threshold')}, PerennialThreshold = {r.get('perennialThreshold')}, "
+              f"TPR = {r['TPR']:.4f} [{boot['TPR'][i, 0]:.4f}, {boot['TPR'][i, 1]:.4f}], "
+              f"FPR = {r['FPR']:.4f} [{boot['FPR'][i, 0]:.4f}, {boot['FPR'][i, 1]:.4f}]")
+
+
+# === Output in the generateROCCurve format ===
+def csv_row(r):
+    return [r.get("weekFreq"), r.get("yearFreq"), r.get("threshold"), r.get("perennialThreshold"),
+            f"{r['TPR']:.6f}", f"{r['FPR']:.6f}", r["TP"], r["FP"], r["FN"], r["TN"]]
+
+
+def print_roc_report(results):
+    ordered = sort_by_fpr(results)
+    print(f"Generating ROC curve with {len(ordered)} data points...")
+    print("ROC Results (CSV format):")
+    print(",".join(CSV_FIELDS))
+    for r in ordered:
+        print(",".join(str(v) for v in csv_row(r)))
+
+    print(f"Calculated AUC: {auc(ordered):.4f}")
+    best = best_youden(ordered)
+    if best is not None:
+        print("Best performing combination (highest TPR-FPR):")
+        print(f"Best: WeekFreq = {best.get('weekFreq')}, YearFreq = {best.get('yearFreq')}, "
+              f"Threshold = {best.get('threshold')}, PerennialThreshold = {best.get('perennialThreshold')}, "
+              f"TPR = {best['TPR']:.4f}, FPR = {best['FPR']:.4f}, Youden Index = {youden(best):.4f}")
+    return best
+
+
+def write_roc_csv(path, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for r in sort_by_fpr(results):
+            writer.writerow(csv_row(r))
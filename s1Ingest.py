@@ -0,0 +1,198 @@
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from glob import glob
+
+import numpy as np
+from osgeo import gdal
+
+from instrumentation import span
+from speckleFilter import lee_block
+
+# === CONFIGURATION ===
+GT_RASTER = "gt.tif"                 # ground-truth raster that defines the AOI grid
+SCENE_DIR = "s1_scenes"              # Sentinel-1 GRD VV GeoTIFFs (dB)
+STORE_DIR = "s1_gridded"
+YEARS = [2018, 2019, 2020, 2021, 2022, 2023, 2024]
+MONSOON_START = 5                    # inclusive start month
+MONSOON_END = 10                     # inclusive end month
+DESPECKLE = True                     # refinedLee on each scene, as s1CollectionForPeriod does
+BLOCK_SIZE = 256
+CREATION_OPTIONS = ["TILED=YES", f"BLOCKXSIZE={BLOCK_SIZE}", f"BLOCKYSIZE={BLOCK_SIZE}",
+                    "COMPRESS=DEFLATE", "PREDICTOR=3"]
+
+SCENE_PATTERN = re.compile(r"^S1[ABCD]_IW_GRD[HM]_1S(DV|SV)_(\d{8}T\d{6})_")
+INDEX_FILE = "index.json"
+
+
+# === Bi-week calendar (listBiWeekStarts in floodDetection.js / newCompareGT.js) ===
+def biweek_starts(year):
+    start = datetime(year, MONSOON_START, 1, tzinfo=timezone.utc)
+    end_month = datetime(year + MONSOON_END // 12, MONSOON_END % 12 + 1, 1, tzinfo=timezone.utc)
+    end = end_month - timedelta(days=1)
+    n_bi = int(np.ceil((end - start).days / 7 / 2))
+    return [start + timedelta(weeks=2 * i) for i in range(n_bi)]
+
+
+def biweek_index(when):
+    starts = biweek_starts(when.year)
+    if when < starts[0] or when >= starts[-1] + timedelta(weeks=2):
+        return None
+    return (when - starts[0]).days // 14
+
+
+# === AOI grid, the local equivalent of getProjection(gtImage) / getSpatialResolution ===
+def grid_from_raster(path):
+    ds = gdal.Open(path)
+    return {
+        "projection": ds.GetProjection(),
+        "transform": list(ds.GetGeoTransform()),
+        "rows": ds.RasterYSize,
+        "cols": ds.RasterXSize,
+    }
+
+
+def grid_bounds(grid):
+    x_min, px_w, _, y_max, _, px_h = grid["transform"]
+    return x_min, y_max + grid["rows"] * px_h, x_min + grid["cols"] * px_w, y_max
+
+
+def scene_time(path):
+    match = SCENE_PATTERN.match(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(2), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+
+
+def vv_band(ds):
+    for i in range(1, ds.RasterCount + 1):
+        if ds.GetRasterBand(i).GetDescription().upper() == "VV":
+            return i
+    return 1
+
+
+# === Warp one scene onto the AOI grid (done once per scene, then cached) ===
+def warp_scene(path, grid):
+    src = gdal.Open(path)
+    band = vv_band(src)
+    warped = gdal.Warp(
+        "", src, format="MEM",
+        bandList=[band],
+        dstSRS=grid["projection"],
+        outputBounds=grid_bounds(grid),
+        width=grid["cols"], height=grid["rows"],
+        resampleAlg="bilinear",
+        srcNodata=0, dstNodata=np.nan,
+        outputType=gdal.GDT_Float32,
+    )
+    return warped.GetRasterBand(1).ReadAsArray()
+
+
+def write_scene(path, array, grid):
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = driver.Create(path, grid["cols"], grid["rows"], 1, gdal.GDT_Float32, CREATION_OPTIONS)
+    out_ds.SetGeoTransform(grid["transform"])
+    out_ds.SetProjection(grid["projection"])
+    band = out_ds.GetRasterBand(1)
+    band.SetNoDataValue(np.nan)
+    band.WriteArray(array)
+    out_ds.FlushCache()
+    out_ds = None
+
+
+def load_index(store_dir):
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {"grid": None, "scenes": [], "skipped": []}
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+
+def save_index(store_dir, index):
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def ingest_scenes(scene_paths, grid, store_dir, despeckle=DESPECKLE, years=YEARS):
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_index(store_dir)
+    if index["grid"] not in (None, grid):
+        raise ValueError(f"{store_dir} was built for a different AOI grid")
+    index["grid"] = grid
+    # Scenes that miss the AOI are remembered too, so reruns don't warp them again
+    skipped = index.setdefault("skipped", [])
+    done = {s["scene"] for s in index["scenes"]} | set(skipped)
+
+    for i, path in enumerate(scene_paths):
+        scene = os.path.splitext(os.path.basename(path))[0]
+        when = scene_time(path)
+        if scene in done or when is None or when.year not in years:
+            continue
+        biweek = biweek_index(when)
+        if biweek is None:
+            continue
+
+        print(f"Warping {i+1}/{len(scene_paths)}: {scene}")
+        with span("warp", nbytes=os.path.getsize(path), items=1):
+            vv = warp_scene(path, grid)
+        valid = np.isfinite(vv)
+        if not valid.any():  # footprint misses the AOI (filterBounds)
+            skipped.append(scene)
+            save_index(store_dir, index)
+            continue
+        if despeckle:
+            vv = lee_block(vv[np.newaxis])[0]
+
+        out_name = f"{scene}.tif"
+        with span("write", nbytes=vv.nbytes, items=1):
+            write_scene(os.path.join(store_dir, out_name), vv, grid)
+        index["scenes"].append({
+            "scene": scene,
+            "file": out_name,
+            "time_start": int(when.timestamp() * 1000),
+            "year": when.year,
+            "biweek": biweek,
+            "valid_fraction": float(valid.mean()),
+            "despeckled": despeckle,
+        })
+        save_index(store_dir, index)
+
+    return index
+
+
+# === Bi-week aggregation: a plain array reduction, no resampling ===
+def read_scene(store_dir, entry):
+    ds = gdal.Open(os.path.join(store_dir, entry["file"]))
+    return ds.GetRasterBand(1).ReadAsArray()
+
+
+def biweek_mean(store_dir, index, year, biweek):
+    entries = [s for s in index["scenes"] if s["year"] == year and s["biweek"] == biweek]
+    if not entries:
+        return None
+    total = None
+    count = None
+    for entry in entries:
+        vv = read_scene(store_dir, entry)
+        valid = np.isfinite(vv)
+        if total is None:
+            total = np.zeros(vv.shape, dtype=np.float64)
+            count = np.zeros(vv.shape, dtype=np.uint16)
+        total[valid] += vv[valid]
+        count += valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (total / count).astype(np.float32)
+
+
+if __name__ == "__main__":
+    grid = grid_from_raster(GT_RASTER)
+    print(f"AOI grid: {grid['cols']} x {grid['rows']} pixels")
+
+    scene_paths = sorted(glob(os.path.join(SCENE_DIR, "*.tif")))
+    print(f"Found {len(scene_paths)} Sentinel-1 scenes")
+
+    index = ingest_scenes(scene_paths, grid, STORE_DIR)
+    print(f"Done. {len(index['scenes'])} gridded scenes in: {STORE_DIR}")
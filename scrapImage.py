@@ -1,15 +1,21 @@
 import json
 import os
+import numpy as np
 import requests
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlencode, urlparse, parse_qs
 from datetime import datetime
 
+import instrumentation
+from instrumentation import span
+
 # === CONFIGURATION ===
-HAR_FILE = "bhuvan.har"  
+HAR_FILE = "bhuvan.har"
 # FLOOD_DATE_CUTOFF = datetime.strptime("2019_08_01_00", "%Y_%m_%d_%H")
-# BBOX_FILTER = [85.25, 20.0, 97.68, 30.55]  
+# BBOX_FILTER = [85.25, 20.0, 97.68, 30.55]
 OUTPUT_DIR = "flood_tiles"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+DROP_COVERED = True         # skip tiles already covered by finer (or equal) tiles of the same layer
+TARGET_RESOLUTION = None    # degrees/pixel; set to request a fresh covering grid instead of the HAR tiles
+TARGET_TILE_SIZE = 256
 
 def intersects_bbox(bbox_tile, bbox_filter):
     xmin, ymin, xmax, ymax = bbox_tile
@@ -24,58 +30,151 @@ def write_world_file(wld_path, bbox, width, height):
         f.write(f"{pixel_x_size}\n0.0\n0.0\n{pixel_y_size}\n{xmin}\n{ymax}\n")
 
 # === Step 1: Load HAR file ===
-with open(HAR_FILE, "r", encoding="utf-8") as f:
-    har_data = json.load(f)
-
-entries = har_data["log"]["entries"]
-tile_urls = []
+def load_har(har_file):
+    with span("har_parse", nbytes=os.path.getsize(har_file)):
+        with open(har_file, "r", encoding="utf-8") as f:
+            har_data = json.load(f)
+    return har_data["log"]["entries"]
 
 # === Step 2: Parse URLs ===
-for entry in entries:
-    url = entry["request"]["url"]
-    parsed = urlparse(url)
-    qs = parse_qs(parsed.query)
-
-    # Only process WMS GetMap requests for flood layers
-    if parsed.path.endswith("wms") and qs.get("REQUEST", [""])[0].lower() == "getmap":
-        layer = qs.get("LAYERS", [None])[0]
-        bbox_str = qs.get("BBOX", [None])[0]
-
-        if not layer or not bbox_str or not layer.startswith("flood:"):
-            continue
-
+def parse_tile_urls(entries):
+    with span("har_filter", items=len(entries)):
+        return _parse_tile_urls(entries)
+
+def _parse_tile_urls(entries):
+    tile_urls = []
+    for entry in entries:
+        url = entry["request"]["url"]
+        parsed = urlparse(url)
+        qs = parse_qs(parsed.query)
+
+        # Only process WMS GetMap requests for flood layers
+        if parsed.path.endswith("wms") and qs.get("REQUEST", [""])[0].lower() == "getmap":
+            layer = qs.get("LAYERS", [None])[0]
+            bbox_str = qs.get("BBOX", [None])[0]
+
+            if not layer or not bbox_str or not layer.startswith("flood:"):
+                continue
+
+            try:
+                # Example: flood:kl_2018_16_07 → date_str = 2018_16_07
+                date_str = "_".join(layer.split(":")[1].split("_")[1:])
+                flood_date = datetime.strptime(date_str, "%Y_%d_%m")  # KL format uses dd_mm
+            except Exception:
+                continue
+
+            bbox = list(map(float, bbox_str.split(",")))
+            tile_urls.append((url, bbox, qs, date_str))
+    return tile_urls
+
+# === Step 3: Drop tiles that finer tiles already cover ===
+# The HAR holds the same area at every zoom level the user panned through. Per
+# layer + CRS, tiles are taken finest first (HAR order within a resolution) and a
+# tile is dropped when the tiles kept so far cover its whole bbox.
+def tile_resolution(bbox, qs):
+    return (bbox[2] - bbox[0]) / int(qs["WIDTH"][0])
+
+def tile_group(qs):
+    return qs["LAYERS"][0], qs.get("SRS", qs.get("CRS", [""]))[0]
+
+def covered_by(bbox, rects, tol):
+    xmin, ymin, xmax, ymax = bbox
+    rects = np.array([r for r in rects if r[0] < xmax and r[2] > xmin and r[1] < ymax and r[3] > ymin])
+    if not len(rects):
+        return False
+    # Cells between every clipped rectangle edge; covered if each cell centre lies in some rectangle
+    xs = np.unique(np.clip(np.concatenate([[xmin, xmax], rects[:, 0], rects[:, 2]]), xmin, xmax))
+    ys = np.unique(np.clip(np.concatenate([[ymin, ymax], rects[:, 1], rects[:, 3]]), ymin, ymax))
+    cx, cy = (xs[:-1] + xs[1:]) / 2, (ys[:-1] + ys[1:]) / 2
+    big = (np.diff(xs)[None, :] > tol) & (np.diff(ys)[:, None] > tol)  # ignore float slivers
+    inside = ((rects[:, 0, None, None] <= cx[None, None, :]) & (rects[:, 2, None, None] >= cx[None, None, :])
+              & (rects[:, 1, None, None] <= cy[None, :, None]) & (rects[:, 3, None, None] >= cy[None, :, None]))
+    return bool(inside.any(axis=0)[big].all())
+
+def drop_covered_tiles(tile_urls):
+    with span("tile_select", items=len(tile_urls)):
+        groups = {}
+        for i, (url, bbox, qs, date_str) in enumerate(tile_urls):
+            groups.setdefault(tile_group(qs), []).append(i)
+
+        keep = []
+        for indices in groups.values():
+            kept = []
+            for i in sorted(indices, key=lambda i: (tile_resolution(tile_urls[i][1], tile_urls[i][2]), i)):
+                bbox = tile_urls[i][1]
+                if not covered_by(bbox, kept, 0.01 * tile_resolution(bbox, tile_urls[i][2])):
+                    kept.append(bbox)
+                    keep.append(i)
+    return [tile_urls[i] for i in sorted(keep)]
+
+# === Optional: minimal GetMap grid at one resolution over what the HAR saw ===
+# Tiles of TARGET_TILE_SIZE pixels, aligned to multiples of their own extent, kept
+# when they intersect any HAR tile of the layer.
+def covering_requests(tile_urls, resolution, tile_size=TARGET_TILE_SIZE):
+    step = resolution * tile_size
+    cells = {}
+    for url, bbox, qs, date_str in tile_urls:
+        base = url.split("?")[0]
+        for ix in range(int(np.floor(bbox[0] / step)), int(np.ceil(bbox[2] / step))):
+            for iy in range(int(np.floor(bbox[1] / step)), int(np.ceil(bbox[3] / step))):
+                key = (tile_group(qs), ix, iy)
+                if key in cells:
+                    continue
+                cell = [ix * step, iy * step, (ix + 1) * step, (iy + 1) * step]
+                params = {k: v[0] for k, v in qs.items()}
+                params.update(BBOX=",".join(repr(v) for v in cell), WIDTH=str(tile_size), HEIGHT=str(tile_size))
+                new_qs = {k: [v] for k, v in params.items()}
+                cells[key] = (f"{base}?{urlencode(params)}", cell, new_qs, date_str)
+    return list(cells.values())
+
+def select_tiles(tile_urls, drop_covered=DROP_COVERED, target_resolution=TARGET_RESOLUTION):
+    if target_resolution:
+        selected = covering_requests(tile_urls, target_resolution)
+    elif drop_covered:
+        selected = drop_covered_tiles(tile_urls)
+    else:
+        return tile_urls
+    print(f"Selected {len(selected)} of {len(tile_urls)} tiles")
+    return selected
+
+# === Step 4: Download ===
+def download_tiles(tile_urls, output_dir, verbose=True):
+    os.makedirs(output_dir, exist_ok=True)
+    saved = 0
+    for i, (url, bbox, qs, date_str) in enumerate(tile_urls):
         try:
-            # Example: flood:kl_2018_16_07 → date_str = 2018_16_07
-            date_str = "_".join(layer.split(":")[1].split("_")[1:])
-            flood_date = datetime.strptime(date_str, "%Y_%d_%m")  # KL format uses dd_mm
-        except Exception:
-            continue
-
-        bbox = list(map(float, bbox_str.split(",")))
-        tile_urls.append((url, bbox, qs, date_str))
-
-
-print(f"Found {len(tile_urls)} matching flood tiles")
-
-# === Step 3: Download ===
-for i, (url, bbox, qs, date_str) in enumerate(tile_urls):
-    try:
-        print(f"Downloading {i+1}/{len(tile_urls)}: {url}")
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            print("Failed download.")
-            continue
-
-        image_path = os.path.join(OUTPUT_DIR, f"tile_{date_str}_{i:03d}.png")
-        with open(image_path, "wb") as f:
-            f.write(response.content)
-
-        width = int(qs["WIDTH"][0])
-        height = int(qs["HEIGHT"][0])
-        wld_path = image_path.replace(".png", ".wld")
-        write_world_file(wld_path, bbox, width, height)
-
-    except Exception as e:
-        print(f" Error: {e}")
-
-print(f"Done. Tiles saved in: {OUTPUT_DIR}")
+            if verbose:
+                print(f"Downloading {i+1}/{len(tile_urls)}: {url}")
+            with span("download", items=1) as s:
+                response = requests.get(url, timeout=10)
+                s.add(nbytes=len(response.content))
+            if response.status_code != 200:
+                print("Failed download.")
+                continue
+
+            image_path = os.path.join(output_dir, f"tile_{date_str}_{i:03d}.png")
+            with span("write", nbytes=len(response.content), items=1):
+                with open(image_path, "wb") as f:
+                    f.write(response.content)
+
+            width = int(qs["WIDTH"][0])
+            height = int(qs["HEIGHT"][0])
+            wld_path = image_path.replace(".png", ".wld")
+            write_world_file(wld_path, bbox, width, height)
+            saved += 1
+
+        except Exception as e:
+            print(f" Error: {e}")
+    return saved
+
+
+if __name__ == "__main__":
+    entries = load_har(HAR_FILE)
+    tile_urls = parse_tile_urls(entries)
+    print(f"Found {len(tile_urls)} matching flood tiles")
+    tile_urls = select_tiles(tile_urls)
+
+    download_tiles(tile_urls, OUTPUT_DIR)
+    print(f"Done. Tiles saved in: {OUTPUT_DIR}")
+    if instrumentation.ENABLED:
+        instrumentation.print_summary()
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import span
+
+# === CONFIGURATION ===
+INPUT_STACK = "vv_stack.npy"            # (time, rows, cols) VV in dB, NaN = nodata
+OUTPUT_STACK = "vv_stack_lee.npy"
+WINDOW = 3                              # 3x3 neighbourhood, same kernel as refinedLee in newCompareGT.js
+TIME_CHUNK = 8
+ROW_CHUNK = 1024
+WORKERS = os.cpu_count()
+
+
+# Separable box sum over the last two axes. Shifted slice adds keep it exact in
+# float32 (a summed-area table drifts on long rows) and cost O(window) per pixel.
+def box_sum(a, size):
+    half = size // 2
+    rows = np.zeros_like(a)
+    for d in range(-half, half + 1):
+        src = slice(max(d, 0), a.shape[-2] + min(d, 0))
+        dst = slice(max(-d, 0), a.shape[-2] + min(-d, 0))
+        rows[..., dst, :] += a[..., src, :]
+    out = np.zeros_like(a)
+    for d in range(-half, half + 1):
+        src = slice(max(d, 0), a.shape[-1] + min(d, 0))
+        dst = slice(max(-d, 0), a.shape[-1] + min(-d, 0))
+        out[..., dst] += rows[..., src]
+    return out
+
+
+# refinedLee on a (time, rows, cols) block: mean/variance over the valid pixels of
+# the window (edges and NaN gaps shrink the count like reduceNeighborhood does),
+# k = var / (var + mean^2), filtered = mean + k * (img - mean)
+def lee_block(block, size=WINDOW):
+    block = block.astype(np.float32, copy=False)
+    valid = np.isfinite(block)
+    x = np.where(valid, block, np.float32(0))
+
+    n = box_sum(valid.astype(np.float32), size)
+    np.maximum(n, 1, out=n)
+    mean = box_sum(x, size)
+    mean /= n
+    var = box_sum(x * x, size)
+    var /= n
+    mean_sq = mean * mean
+    var -= mean_sq
+    np.maximum(var, 0, out=var)
+
+    denom = var + mean_sq
+    k = np.divide(var, denom, out=np.zeros_like(var), where=denom > 0)
+    block = block - mean
+    block *= k
+    block += mean
+    return block
+
+
+def refined_lee(stack, size=WINDOW, out=None, time_chunk=TIME_CHUNK, row_chunk=ROW_CHUNK, workers=WORKERS):
+    squeeze = stack.ndim == 2
+    if squeeze:
+        stack = stack[np.newaxis]
+    if out is None:
+        out = np.empty(stack.shape, dtype=np.float32)
+    out3 = out[np.newaxis] if out.ndim == 2 else out
+
+    halo = size // 2
+    n_time, n_rows = stack.shape[0], stack.shape[1]
+
+    def run(t0, r0):
+        t1 = min(t0 + time_chunk, n_time)
+        r1 = min(r0 + row_chunk, n_rows)
+        lo, hi = max(r0 - halo, 0), min(r1 + halo, n_rows)
+        filtered = lee_block(np.asarray(stack[t0:t1, lo:hi]), size)
+        out3[t0:t1, r0:r1] = filtered[:, r0 - lo:r0 - lo + (r1 - r0)]
+
+    jobs = [(t0, r0) for t0 in range(0, n_time, time_chunk) for r0 in range(0, n_rows, row_chunk)]
+    # numpy releases the GIL in the array kernels, so threads scale without copying chunks between processes
+    with span("despeckle", nbytes=out3.nbytes, items=n_time), ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda job: run(*job), jobs))
+
+    return out3[0] if squeeze else out
+
+
+if __name__ == "__main__":
+    stack = np.load(INPUT_STACK, mmap_mode="r")
+    print(f"Despeckling stack of shape {stack.shape}")
+    out = np.lib.format.open_memmap(OUTPUT_STACK, mode="w+", dtype=np.float32, shape=stack.shape)
+    refined_lee(stack, out=out)
+    out.flush()
+    print(f"Done. Filtered stack saved in: {OUTPUT_STACK}")
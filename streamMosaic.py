@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+
+import numpy as np
+import requests
+
+import instrumentation
+from instrumentation import span
+from mosaic import BlankTiles, UnionWriter, decode_tile_bytes, pixel_key, resolution_levels, union_grid
+from scrapImage import HAR_FILE, OUTPUT_DIR, load_har, parse_tile_urls, select_tiles, write_world_file
+
+# === CONFIGURATION ===
+OUTPUT_PATH = "flood_union.tif"
+SAVE_TILES = False          # also keep the PNG + .wld files in OUTPUT_DIR, as scrapImage.py does
+DOWNLOADERS = 8
+DECODERS = 4                # PNG inflate runs outside the GIL, so threads are enough
+QUEUE_SIZE = 64             # tiles in flight between stages; bounds memory
+
+# scrapImage.py + Merge in one pass, without the disk round trip:
+#
+#   downloaders --(bytes)--> decoders --(mask)--> union writer
+#
+# The output extent is known up front from the GetMap BBOX/WIDTH/HEIGHT of every
+# tile, so the union GeoTIFF is created before the first download and each mask
+# is pasted into its window as soon as it's decoded.
+
+
+# === Step 1: Georeferencing of every tile, straight from its GetMap request ===
+def tile_jobs(tile_urls):
+    jobs, bounds = [], []
+    for i, (url, bbox, qs, date_str) in enumerate(tile_urls):
+        width = int(qs["WIDTH"][0])
+        height = int(qs["HEIGHT"][0])
+        xmin, ymin, xmax, ymax = bbox
+        transform = [xmin, (xmax - xmin) / width, 0, ymax, 0, (ymin - ymax) / height]
+        jobs.append((i, url, transform, bbox, width, height, date_str))
+        bounds.append((xmin, ymin, xmax, ymax))
+    return jobs, bounds
+
+
+def save_tile(save_dir, job, content):
+    i, _, _, bbox, width, height, date_str = job
+    image_path = os.path.join(save_dir, f"tile_{date_str}_{i:03d}.png")
+    with open(image_path, "wb") as f:
+        f.write(content)
+    write_world_file(image_path.replace(".png", ".wld"), bbox, width, height)
+
+
+# === Step 2: Stage workers ===
+def download_worker(jobs, raw, save_dir, verbose):
+    session = requests.Session()
+    while True:
+        try:
+            job = jobs.get_nowait()
+        except queue.Empty:
+            return
+        i, url = job[0], job[1]
+        try:
+            if verbose:
+                print(f"Downloading {i+1}: {url}")
+            with span("download", items=1) as s:
+                response = session.get(url, timeout=10)
+                s.add(nbytes=len(response.content))
+            if response.status_code != 200:
+                print("Failed download.")
+                continue
+            if save_dir is not None:
+                with span("write", nbytes=len(response.content), items=1):
+                    save_tile(save_dir, job, response.content)
+            raw.put((job, response.content))  # blocks while the decoders are behind
+        except Exception as e:
+            print(f" Error: {e}")
+
+
+def decode_worker(raw, masks, blank_tiles):
+    while True:
+        item = raw.get()
+        if item is None:
+            masks.put(None)
+            return
+        job, content = item
+        try:
+            with span("decode", nbytes=len(content), items=1):
+                mask = decode_tile_bytes(content, blank_tiles, job[1])
+        except Exception as e:
+            print(f" Error decoding {job[1]}: {e}")
+            mask = None
+        masks.put((job, mask))
+
+
+# === Step 3: Run the pipeline; this thread owns the union writer ===
+def stream_mosaic(tile_urls, output_path, save_dir=None, downloaders=DOWNLOADERS, decoders=DECODERS,
+                  queue_size=QUEUE_SIZE, verbose=True):
+    jobs, bounds = tile_jobs(tile_urls)
+    if not jobs:
+        raise ValueError("No tiles to download.")
+    transforms = [(job[1], job[2]) for job in jobs]
+    x_min, y_max, px_w, px_h, rows, cols = union_grid(transforms, bounds)
+    level_of = resolution_levels(transforms)
+    writer = UnionWriter(output_path, rows, cols, x_min, y_max, px_w, px_h, len(level_of))
+    if save_dir is not None:
+        os.makedirs(save_dir, exist_ok=True)
+
+    job_queue = queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    raw = queue.Queue(maxsize=queue_size)
+    masks = queue.Queue(maxsize=queue_size)
+    counts = {"downloaded": 0, "pasted": 0, "blank": 0}
+    blank_tiles = BlankTiles()
+
+    download_threads = [threading.Thread(target=download_worker, args=(job_queue, raw, save_dir, verbose),
+                                         daemon=True) for _ in range(downloaders)]
+    decode_threads = [threading.Thread(target=decode_worker, args=(raw, masks, blank_tiles), daemon=True)
+                      for _ in range(decoders)]
+    for t in download_threads + decode_threads:
+        t.start()
+
+    # Once every download is queued, tell each decoder to stop
+    def close_raw():
+        for t in download_threads:
+            t.join()
+        for _ in range(decoders):
+            raw.put(None)
+    threading.Thread(target=close_raw, daemon=True).start()
+
+    finished = 0
+    while finished < decoders:
+        item = masks.get()
+        if item is None:
+            finished += 1
+            continue
+        job, mask = item
+        counts["downloaded"] += 1
+        level = level_of[pixel_key(job[2])]
+        if mask is None:
+            counts["blank"] += 1
+            if level > 1:  # a blank finer tile still clears coarser data under it
+                writer.paste(np.zeros((job[5], job[4]), dtype=np.uint8), job[2], level)
+        elif writer.paste(mask, job[2], level):
+            counts["pasted"] += 1
+
+    writer.close()
+    if verbose:
+        print(f"\nDownloaded {counts['downloaded']}/{len(jobs)} tiles: "
+              f"{counts['pasted']} pasted, {counts['blank']} blank")
+    return counts
+
+
+if __name__ == "__main__":
+    tile_urls = parse_tile_urls(load_har(HAR_FILE))
+    print(f"Found {len(tile_urls)} matching flood tiles")
+    tile_urls = select_tiles(tile_urls)
+
+    stream_mosaic(tile_urls, OUTPUT_PATH, OUTPUT_DIR if SAVE_TILES else None)
+    print("\nFinal flood union saved to:", OUTPUT_PATH)
+    if instrumentation.ENABLED:
+        instrumentation.print_summary()
@@ -0,0 +1,285 @@
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+from compositeStore import COMPOSITE_DIR, CompositeStore, gap_filled_store
+from floodClassification import GAP_POLICY
+from rocMetrics import print_roc_report, write_roc_csv
+from s1Ingest import GT_RASTER
+from thresholdSweep import PARAM_GRID, SWEEP_BIWEEK, SWEEP_YEAR, SweepEvaluator, load_ground_truth
+
+# === CONFIGURATION ===
+QUEUE_DIR = "sweep_queue"          # on a filesystem every node can see
+REGIONS = {                        # GT region -> its composite store and ground truth raster
+    "default": {"composite_dir": COMPOSITE_DIR, "gt_raster": GT_RASTER},
+}
+LEASE_SECONDS = 600                # a claim not renewed for this long is considered dead
+MAX_ATTEMPTS = 3
+LOCAL_WORKERS = 4                  # for "python sweepQueue.py local"
+
+# Layout of QUEUE_DIR:
+#   spec.json               sweep definition written by init
+#   items/<id>.json         one work item: region x threshold x perennialThreshold,
+#                           covering every (weekFreq, yearFreq) pair so a worker
+#                           builds the threshold's water masks once per item
+#   leases/<id>.lease       claim, created with O_EXCL; mtime is the heartbeat
+#   results/<id>.json       ROC rows of a finished item (written via rename)
+#   failed/<id>.json        items that failed MAX_ATTEMPTS times
+# Only atomic create / rename / replace are used, so it works over NFS-style shares.
+
+
+def queue_paths(queue_dir):
+    return {name: os.path.join(queue_dir, name) for name in ("items", "leases", "results", "failed")}
+
+
+def write_json_atomic(path, obj):
+    tmp = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+# === Step 1: init - preprocess every region once and write the work items ===
+def init_queue(queue_dir=QUEUE_DIR, regions=REGIONS, grid=PARAM_GRID, year=SWEEP_YEAR, biweek=SWEEP_BIWEEK,
+               gap_policy=GAP_POLICY):
+    paths = queue_paths(queue_dir)
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+
+    spec_regions = {}
+    for name, region in regions.items():
+        # Gap filling happens here, not in the workers, so nodes never race on it
+        filled_dir = os.path.join(queue_dir, f"composites_{name}")
+        store = gap_filled_store(CompositeStore(region["composite_dir"]), gap_policy, filled_dir)
+        # Absolute, so workers started from another directory find them
+        spec_regions[name] = {"composite_dir": os.path.abspath(store.store_dir),
+                              "gt_raster": os.path.abspath(region["gt_raster"])}
+
+    write_json_atomic(os.path.join(queue_dir, "spec.json"),
+                      {"regions": spec_regions, "grid": grid, "year": year, "biweek": biweek})
+
+    n_items = 0
+    for name in regions:
+        for threshold, perennial in itertools.product(grid["threshold"], grid["perennialThreshold"]):
+            item_id = f"{name}__vv{threshold}__p{perennial}"
+            write_json_atomic(os.path.join(paths["items"], item_id + ".json"),
+                              {"id": item_id, "region": name, "threshold": threshold,
+                               "perennialThreshold": perennial})
+            n_items += 1
+    print(f"Queued {n_items} work items ({n_items * len(grid['weekFreq']) * len(grid['yearFreq'])} combinations)"
+          f" in {queue_dir}")
+    return n_items
+
+
+# === Step 2: leases ===
+def lease_path(paths, item_id):
+    return os.path.join(paths["leases"], item_id + ".lease")
+
+
+def try_claim(paths, item_id, worker_id, lease_seconds=LEASE_SECONDS):
+    path = lease_path(paths, item_id)
+    attempts = 1
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.stat(path).st_mtime < lease_seconds:
+                return None  # someone is alive on it
+        except FileNotFoundError:
+            return None
+        return take_over(path, worker_id, lease_seconds)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"worker": worker_id, "attempts": attempts, "claimed": time.time()}, f)
+    return attempts
+
+
+# Replaces a stale lease with our own while holding an O_EXCL side lock, and re-checks
+# it under that lock: a worker that judged the lease stale before someone else took it
+# over would otherwise overwrite the fresh lease. The new lease goes in with os.replace,
+# so the path never stops existing and a plain O_EXCL claim can't slip in between.
+# Returns the attempt number, or None.
+def take_over(path, worker_id, lease_seconds):
+    lock = path + ".takeover"
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            if time.time() - os.stat(lock).st_mtime > lease_seconds:
+                os.remove(lock)  # left behind by a worker that died mid-takeover
+        except FileNotFoundError:
+            pass
+        return None
+    try:
+        if time.time() - os.stat(path).st_mtime < lease_seconds:
+            return None  # taken over (or renewed) since we looked
+        try:
+            attempts = read_json(path).get("attempts", 1) + 1
+        except ValueError:
+            attempts = 2
+        write_json_atomic(path, {"worker": worker_id, "attempts": attempts, "claimed": time.time()})
+        return attempts
+    except FileNotFoundError:
+        return None  # released in the meantime
+    finally:
+        os.remove(lock)
+
+
+def release(paths, item_id, worker_id):
+    path = lease_path(paths, item_id)
+    try:
+        if read_json(path).get("worker") == worker_id:  # not if it expired and was taken over
+            os.remove(path)
+    except (OSError, ValueError):
+        pass
+
+
+# Touches the lease while the item runs so it doesn't expire under a live worker
+class Heartbeat:
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# === Step 3: worker - claim, run, write, release, until nothing is left ===
+def pending_items(paths):
+    done = set(os.listdir(paths["results"])) | set(os.listdir(paths["failed"]))
+    return [name[:-5] for name in os.listdir(paths["items"]) if name.endswith(".json") and name not in done]
+
+
+def run_item(item, spec, evaluators):
+    region = item["region"]
+    if region not in evaluators:
+        info = spec["regions"][region]
+        evaluators[region] = SweepEvaluator(CompositeStore(info["composite_dir"]),
+                                            load_ground_truth(info["gt_raster"]), spec["year"], spec["biweek"])
+    evaluator = evaluators[region]
+    rows = []
+    for week_freq, year_freq in itertools.product(spec["grid"]["weekFreq"], spec["grid"]["yearFreq"]):
+        result = evaluator.evaluate({"weekFreq": week_freq, "yearFreq": year_freq, "threshold": item["threshold"],
+                                     "perennialThreshold": item["perennialThreshold"]})
+        rows.append(dict(result, region=region))
+    return rows
+
+
+def run_worker(queue_dir=QUEUE_DIR, worker_id=None, lease_seconds=LEASE_SECONDS, poll=5.0, verbose=True):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    paths = queue_paths(queue_dir)
+    spec = read_json(os.path.join(queue_dir, "spec.json"))
+    evaluators = {}
+    completed = 0
+    rng = random.Random(worker_id)
+
+    while True:
+        pending = pending_items(paths)
+        if not pending:
+            break
+        # Same threshold stays together (warm caches), start point varies per worker (less contention)
+        pending.sort()
+        start = rng.randrange(len(pending))
+        claimed_any = False
+        for item_id in pending[start:] + pending[:start]:
+            if os.path.exists(os.path.join(paths["results"], item_id + ".json")):
+                continue
+            attempts = try_claim(paths, item_id, worker_id, lease_seconds)
+            if attempts is None:
+                continue
+            claimed_any = True
+            item = read_json(os.path.join(paths["items"], item_id + ".json"))
+            if attempts > MAX_ATTEMPTS:
+                write_json_atomic(os.path.join(paths["failed"], item_id + ".json"), dict(item, attempts=attempts - 1))
+                release(paths, item_id, worker_id)
+                print(f"[{worker_id}] giving up on {item_id} after {attempts - 1} attempts")
+                continue
+            try:
+                with Heartbeat(lease_path(paths, item_id), lease_seconds / 3):
+                    rows = run_item(item, spec, evaluators)
+                write_json_atomic(os.path.join(paths["results"], item_id + ".json"), rows)
+                completed += 1
+                if verbose:
+                    print(f"[{worker_id}] done {item_id} ({len(rows)} combinations)")
+            except Exception as e:
+                # Keep the lease's attempt count but let it expire at once so the item is retried
+                print(f"[{worker_id}] failed {item_id}: {e}")
+                os.utime(lease_path(paths, item_id), (0, 0))
+                continue
+            release(paths, item_id, worker_id)
+        if not claimed_any:
+            time.sleep(poll)  # everything left is leased by live workers
+    return completed
+
+
+# === Step 4: reduce - merge every result file into one ROC table per region ===
+def reduce_results(queue_dir=QUEUE_DIR, output_pattern="roc_results_{region}.csv"):
+    paths = queue_paths(queue_dir)
+    by_region = {}
+    for name in sorted(os.listdir(paths["results"])):
+        if name.endswith(".json"):
+            for row in read_json(os.path.join(paths["results"], name)):
+                by_region.setdefault(row["region"], []).append(row)
+
+    for region, rows in sorted(by_region.items()):
+        print(f"\n=== Region: {region} ===")
+        print_roc_report(rows)
+        write_roc_csv(output_pattern.format(region=region), rows)
+        print("ROC table saved to:", output_pattern.format(region=region))
+    return by_region
+
+
+def queue_status(queue_dir=QUEUE_DIR):
+    paths = queue_paths(queue_dir)
+    counts = {name: len([n for n in os.listdir(path) if n.endswith((".json", ".lease"))])
+              for name, path in paths.items()}
+    print(f"items {counts['items']}, leased {counts['leases']}, done {counts['results']}, failed {counts['failed']}")
+    return counts
+
+
+def run_local(queue_dir=QUEUE_DIR, workers=LOCAL_WORKERS):
+    procs = [multiprocessing.Process(target=run_worker, args=(queue_dir, f"local-{i}")) for i in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "init":
+        init_queue()
+    elif command == "work":
+        run_worker()
+    elif command == "local":
+        run_local(workers=int(sys.argv[2]) if len(sys.argv) > 2 else LOCAL_WORKERS)
+    elif command == "reduce":
+        reduce_results()
+    elif command == "status":
+        queue_status()
+    else:
+        print("Usage: python sweepQueue.py [init|work|local [n]|reduce|status]")
@@ -0,0 +1,160 @@
+import itertools
+import sys
+
+import numpy as np
+from osgeo import gdal
+from scipy import ndimage
+
+from compositeStore import COMPOSITE_DIR, CompositeStore, gap_filled_store
+from floodClassification import (FILLED_DIR, FLOOD, GAP_POLICY, SEASONAL, SMUDGE_RADIUS_M, base_from_frequency,
+                                 classify_from_frequencies, classify_perennial_and_non_water, disk_kernel,
+                                 pixel_size_m, water_and_valid, water_frequency)
+from instrumentation import span
+from rocMetrics import (PARAM_NAMES, block_confusion_counts, bootstrap_roc, pareto_front, positive_mask,
+                        print_bootstrap_report, print_roc_report, roc_result, write_roc_csv, youden)
+from s1Ingest import GT_RASTER
+
+# === CONFIGURATION (production grids from newCompareGT.js) ===
+PARAM_GRID = {
+    "weekFreq": [0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+    "yearFreq": [0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+    "threshold": [-15, -16, -17, -18],
+    "perennialThreshold": [0.8, 0.82, 0.84, 0.86, 0.88, 0.90, 0.92, 0.94, 0.96],
+}
+SWEEP_YEAR = 2018          # processSelectedMask(2018, 3, ...)
+SWEEP_BIWEEK = 3
+COARSE_STEP = 3            # grid stride of the first pass along every axis
+KEEP_BEST = 4              # best-Youden points refined per round, on top of the Pareto front
+ROC_CSV = "roc_results.csv"
+BOOTSTRAP = True           # block-bootstrap intervals from the per-block counts kept during the sweep
+
+
+# === One pipeline run per parameter combination, with everything reusable cached ===
+# A threshold fixes the water masks and all frequencies; the perennial threshold
+# only re-cuts the archive frequency; weekFreq / yearFreq only re-run the final
+# classification. So a combination costs one classification + smudge + count.
+# Counts are kept per spatial block so intervals can be bootstrapped afterwards.
+class SweepEvaluator:
+    def __init__(self, store, ground_truth, year=SWEEP_YEAR, biweek=SWEEP_BIWEEK, radius_m=SMUDGE_RADIUS_M):
+        self.store = store
+        self.ground_truth = positive_mask(ground_truth)  # once, not per evaluation
+        self.year, self.biweek = year, biweek
+        self.kernel = disk_kernel(radius_m, *pixel_size_m(store.grid))
+        self._period = {}
+        self.results = {}
+        self.block_counts = {}
+
+    def period_stats(self, threshold):
+        if threshold not in self._period:
+            with span("sweep_threshold", items=1):
+                _, archive_freq = classify_perennial_and_non_water(self.store, threshold)
+                water_now, valid_now = water_and_valid(self.store.composite(self.year, self.biweek), threshold)
+                freq_year = water_frequency(self.store.year_stack(self.year), threshold)
+                freq_biweek = water_frequency(self.store.biweek_across_years(self.biweek), threshold)
+            self._period[threshold] = (archive_freq, water_now, valid_now, freq_year, freq_biweek)
+        return self._period[threshold]
+
+    def evaluate(self, params):
+        key = tuple(params[name] for name in PARAM_NAMES)
+        if key in self.results:
+            return self.results[key]
+
+        archive_freq, water_now, valid_now, freq_year, freq_biweek = self.period_stats(params["threshold"])
+        with span("sweep_eval", items=1):
+            base = base_from_frequency(archive_freq, params["perennialThreshold"])
+            classification = classify_from_frequencies(base, water_now, valid_now, freq_year, freq_biweek,
+                                                       params["yearFreq"], params["weekFreq"])
+            mask = (classification == SEASONAL) | (classification == FLOOD)
+            if self.kernel.size > 1:
+                mask = ndimage.binary_dilation(mask, structure=self.kernel)
+            blocks = block_confusion_counts(mask, self.ground_truth)
+            result = roc_result(params, *(int(v) for v in blocks.sum(axis=0)))
+        self.results[key] = result
+        self.block_counts[key] = blocks
+        return result
+
+    def bootstrap(self, results, **kwargs):
+        return bootstrap_roc([self.block_counts[tuple(r[name] for name in PARAM_NAMES)] for r in results], **kwargs)
+
+
+# === Grid helpers: points are tuples of indices into PARAM_GRID ===
+def point_params(point, grid=PARAM_GRID):
+    return {name: grid[name][i] for name, i in zip(PARAM_NAMES, point)}
+
+
+def axis_positions(n, step):
+    positions = list(range(0, n, step))
+    if positions[-1] != n - 1:
+        positions.append(n - 1)  # always include the end of each range
+    return positions
+
+
+def neighbours(point, step, sizes):
+    ranges = [sorted({max(0, min(n - 1, i + d)) for d in (-step, 0, step)}) for i, n in zip(point, sizes)]
+    return set(itertools.product(*ranges))
+
+
+def evaluate_points(evaluator, points, grid):
+    # Grouped by threshold so each threshold's stats are built once and stay hot
+    order = sorted(points, key=lambda p: (p[PARAM_NAMES.index("threshold")], p))
+    return {p: evaluator.evaluate(point_params(p, grid)) for p in order}
+
+
+# === Coarse grid, then refine around the Pareto front and the best Youden points ===
+def coarse_to_fine(evaluator, grid=PARAM_GRID, coarse_step=COARSE_STEP, keep_best=KEEP_BEST, verbose=True):
+    sizes = [len(grid[name]) for name in PARAM_NAMES]
+    points = set(itertools.product(*[axis_positions(n, coarse_step) for n in sizes]))
+    evaluated = evaluate_points(evaluator, points, grid)
+    if verbose:
+        print(f"Coarse pass (step {coarse_step}): {len(evaluated)} combinations")
+
+    step = coarse_step
+    while True:
+        front_ids = {id(r) for r in pareto_front(evaluated.values())}
+        front = [p for p, r in evaluated.items() if id(r) in front_ids]
+        best = sorted(evaluated, key=lambda p: youden(evaluated[p]), reverse=True)[:keep_best]
+        candidates = set()
+        for p in set(front) | set(best):
+            candidates |= neighbours(p, step, sizes)
+        new = candidates - set(evaluated)
+
+        if new:
+            evaluated.update(evaluate_points(evaluator, new, grid))
+            if verbose:
+                print(f"Refine pass (step {step}): +{len(new)} combinations")
+        elif step == 1:
+            break  # nothing left to look at next to the frontier
+        step = max(1, step // 2)
+
+    if verbose:
+        total = int(np.prod(sizes))
+        print(f"Evaluated {len(evaluated)} of {total} combinations ({100 * len(evaluated) / total:.1f}%)")
+    return list(evaluated.values())
+
+
+def full_sweep(evaluator, grid=PARAM_GRID):
+    sizes = [len(grid[name]) for name in PARAM_NAMES]
+    return list(evaluate_points(evaluator, itertools.product(*[range(n) for n in sizes]), grid).values())
+
+
+def load_ground_truth(path=GT_RASTER):
+    return gdal.Open(path).GetRasterBand(1).ReadAsArray()
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "adaptive"
+    store = gap_filled_store(CompositeStore(COMPOSITE_DIR), GAP_POLICY, FILLED_DIR)
+    evaluator = SweepEvaluator(store, load_ground_truth())
+
+    if mode == "adaptive":
+        results = coarse_to_fine(evaluator)
+    elif mode == "full":
+        results = full_sweep(evaluator)
+    else:
+        sys.exit("Usage: python thresholdSweep.py [adaptive|full]")
+
+    print_roc_report(results)
+    if BOOTSTRAP:
+        print_bootstrap_report(results, evaluator.bootstrap(results))
+    write_roc_csv(ROC_CSV, results)
+    print("ROC table saved to:", ROC_CSV)
@@ -0,0 +1,283 @@
+import io
+import math
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from osgeo import gdal, osr
+from PIL import Image
+
+from instrumentation import span
+
+# === CONFIGURATION ===
+SOURCE_RASTER = "flood_union.tif"
+PYRAMID_DIR = "flood_tiles_xyz"
+MIN_ZOOM = 6
+MAX_ZOOM = 14
+TILE_SIZE = 256
+TILE_FORMAT = "png"            # png | webp
+PALETTE = "union"              # key into PALETTES
+RESAMPLING = "max"             # keeps thin flood features visible at low zoom; use "near" for classes
+WORKERS = os.cpu_count()
+HOST = "127.0.0.1"
+PORT = 8000
+CACHE_BYTES = 256 * 1024 * 1024
+
+# Value -> RGB; value 0 is always transparent
+PALETTES = {
+    "union": {255: (0, 255, 255)},                                   # Merge output
+    "flood": {1: (255, 0, 0)},                                       # flood_mask rasters
+    "classification": {1: (0, 0, 255), 2: (0, 255, 0), 3: (255, 255, 0), 4: (255, 0, 0)},  # floodDetection.js
+}
+
+ORIGIN_SHIFT = 20037508.342789244
+
+
+# === Web-mercator tile maths ===
+def lonlat_to_tile(lon, lat, zoom):
+    n = 2 ** zoom
+    lat = np.clip(lat, -85.0511, 85.0511)
+    x = np.floor((lon + 180.0) / 360.0 * n).astype(np.int64)
+    lat_r = np.radians(lat)
+    y = np.floor((1.0 - np.log(np.tan(lat_r) + 1.0 / np.cos(lat_r)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def tile_bounds_3857(zoom, x, y):
+    size = 2 * ORIGIN_SHIFT / 2 ** zoom
+    xmin = -ORIGIN_SHIFT + x * size
+    ymax = ORIGIN_SHIFT - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def tile_path(pyramid_dir, zoom, x, y, fmt=TILE_FORMAT):
+    return os.path.join(pyramid_dir, str(zoom), str(x), f"{y}.{fmt}")
+
+
+# === Which tiles hold data: map every non-zero pixel to its max-zoom tile ===
+# Only non-empty tiles get rendered; lower zooms are the parents of those tiles.
+def occupied_tiles(ds, max_zoom, block_rows=1024):
+    transform = ds.GetGeoTransform()
+    src_srs = osr.SpatialReference(wkt=ds.GetProjection())
+    wgs84 = osr.SpatialReference()
+    wgs84.ImportFromEPSG(4326)
+    for s in (src_srs, wgs84):
+        s.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    to_wgs84 = None if src_srs.IsSame(wgs84) else osr.CoordinateTransformation(src_srs, wgs84)
+
+    band = ds.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    tiles = set()
+    for r0 in range(0, ds.RasterYSize, block_rows):
+        n_rows = min(block_rows, ds.RasterYSize - r0)
+        block = band.ReadAsArray(0, r0, ds.RasterXSize, n_rows)
+        data = block != 0
+        if nodata is not None and nodata != 0:
+            data &= block != nodata
+        rows, cols = np.nonzero(data)
+        if rows.size == 0:
+            continue
+        px = transform[0] + (cols + 0.5) * transform[1] + (rows + r0 + 0.5) * transform[2]
+        py = transform[3] + (cols + 0.5) * transform[4] + (rows + r0 + 0.5) * transform[5]
+        if to_wgs84 is not None:
+            pts = np.array(to_wgs84.TransformPoints(np.column_stack([px, py]).tolist()))
+            px, py = pts[:, 0], pts[:, 1]
+        tx, ty = lonlat_to_tile(px, py, max_zoom)
+        tiles.update(np.unique(tx * (2 ** max_zoom) + ty).tolist())
+
+    n = 2 ** max_zoom
+    return [(t // n, t % n) for t in tiles]
+
+
+def pyramid_tiles(max_zoom_tiles, min_zoom, max_zoom):
+    levels = {max_zoom: sorted(set(max_zoom_tiles))}
+    for zoom in range(max_zoom - 1, min_zoom - 1, -1):
+        levels[zoom] = sorted({(x // 2, y // 2) for x, y in levels[zoom + 1]})
+    return levels
+
+
+# === Rendering (runs in worker processes, one open dataset per worker) ===
+_worker_ds = None
+
+
+def _open_source(path):
+    global _worker_ds
+    _worker_ds = gdal.Open(path)
+
+
+def colorize(values, palette, fmt):
+    if fmt == "png":
+        lut = np.zeros(256, dtype=np.uint8)
+        flat_palette = [0, 0, 0]
+        for i, (value, rgb) in enumerate(sorted(palette.items()), start=1):
+            lut[value] = i
+            flat_palette.extend(rgb)
+        img = Image.fromarray(lut[values], mode="P")
+        img.putpalette(flat_palette)
+        img.info["transparency"] = 0
+        return img
+    rgba = np.zeros(values.shape + (4,), dtype=np.uint8)
+    for value, rgb in palette.items():
+        rgba[values == value] = rgb + (255,)
+    return Image.fromarray(rgba, mode="RGBA")
+
+
+def render_tile(job):
+    zoom, x, y, pyramid_dir, palette_name, fmt, resampling = job
+    warped = gdal.Warp(
+        "", _worker_ds, format="MEM",
+        dstSRS="EPSG:3857",
+        outputBounds=tile_bounds_3857(zoom, x, y),
+        width=TILE_SIZE, height=TILE_SIZE,
+        resampleAlg=resampling,
+        dstNodata=0,
+    )
+    values = warped.GetRasterBand(1).ReadAsArray().astype(np.uint8)
+    if not values.any():
+        return 0
+
+    path = tile_path(pyramid_dir, zoom, x, y, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    img = colorize(values, PALETTES[palette_name], fmt)
+    if fmt == "png":
+        img.save(path, format="PNG", optimize=False)
+    else:
+        img.save(path, format="WEBP", lossless=True)
+    return os.path.getsize(path)
+
+
+# Overviews built with the same resampling as the warp, in a VRT copy inside tmp_dir
+# so nothing is written next to the source. Without a matching overview method
+# (max needs GDAL >= 3.6) the full raster is warped instead.
+OVERVIEW_METHODS = {"max": "MAX", "near": "NEAREST", "mode": "MODE", "average": "AVERAGE"}
+
+
+def overview_copy(source, tmp_dir, resampling):
+    method = OVERVIEW_METHODS.get(resampling)
+    if method is None or (method == "MAX" and int(gdal.VersionInfo()) < 3060000):
+        return source
+    vrt_path = os.path.join(tmp_dir, "source.vrt")
+    gdal.Translate(vrt_path, os.path.abspath(source), format="VRT")
+    ds = gdal.Open(vrt_path)
+    ds.BuildOverviews(method, [2, 4, 8, 16, 32, 64])  # -> source.vrt.ovr
+    ds = None
+    return vrt_path
+
+
+def build_pyramid(source=SOURCE_RASTER, pyramid_dir=PYRAMID_DIR, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+                  palette=PALETTE, fmt=TILE_FORMAT, resampling=RESAMPLING, workers=WORKERS):
+    ds = gdal.Open(source)
+    with span("tile_scan"):
+        levels = pyramid_tiles(occupied_tiles(ds, max_zoom), min_zoom, max_zoom)
+    ds = None
+
+    jobs = [(zoom, x, y, pyramid_dir, palette, fmt, resampling)
+            for zoom in sorted(levels) for x, y in levels[zoom]]
+    print(f"Rendering {len(jobs)} non-empty tiles for zooms {min_zoom}-{max_zoom}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Low zooms warp from the overviews instead of the full raster
+        render_source = overview_copy(source, tmp_dir, resampling)
+        with span("tile_render", items=len(jobs)) as s, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_open_source,
+                                    initargs=(render_source,)) as pool:
+            sizes = list(pool.map(render_tile, jobs, chunksize=32))
+            s.add(nbytes=sum(sizes))
+
+    written = sum(1 for size in sizes if size)
+    print(f"Done. {written} tiles written to: {pyramid_dir}")
+    return written
+
+
+# === Local tile server with an in-memory LRU ===
+class LRUCache:
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size=None):
+        size = len(value) if size is None else size
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and self._items:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.nbytes -= old_size
+
+
+def empty_tile(fmt):
+    buf = io.BytesIO()
+    Image.new("RGBA", (TILE_SIZE, TILE_SIZE)).save(buf, format="PNG" if fmt == "png" else "WEBP")
+    return buf.getvalue()
+
+
+def make_tile_handler(pyramid_dir, fmt=TILE_FORMAT, cache_bytes=CACHE_BYTES):
+    cache = LRUCache(cache_bytes)
+    blank = empty_tile(fmt)
+    content_type = f"image/{fmt}"
+
+    class TileRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")
+            try:
+                zoom, x = int(parts[0]), int(parts[1])
+                y = int(parts[2].split(".")[0])
+            except (IndexError, ValueError):
+                self.send_error(404, "Expected /{z}/{x}/{y}." + fmt)
+                return
+
+            body = cache.get((zoom, x, y))
+            if body is None:
+                path = tile_path(pyramid_dir, zoom, x, y, fmt)
+                try:
+                    with open(path, "rb") as f:
+                        body = f.read()
+                except FileNotFoundError:
+                    body = blank  # empty tiles were skipped at build time
+                cache.put((zoom, x, y), body)
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "public, max-age=3600")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return TileRequestHandler
+
+
+def serve_tiles(pyramid_dir=PYRAMID_DIR, host=HOST, port=PORT, fmt=TILE_FORMAT):
+    server = ThreadingHTTPServer((host, port), make_tile_handler(pyramid_dir, fmt))
+    print(f"Serving {pyramid_dir} at http://{host}:{port}/{{z}}/{{x}}/{{y}}.{fmt}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        build_pyramid()
+    elif command == "serve":
+        serve_tiles()
+    else:
+        print("Usage: python tilePyramid.py [build|serve]")
@@ -0,0 +1,164 @@
+import csv
+import os
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from compositeStore import COMPOSITE_DIR, CompositeStore
+from floodClassification import BATCH_FLOOD
+from instrumentation import span, traced
+from s1Ingest import GT_RASTER
+
+# === CONFIGURATION ===
+ZONES_FILE = "admin_zones.geojson"     # districts / blocks / villages
+ZONE_NAME_FIELD = "Name"
+FLOOD_CUBE = BATCH_FLOOD               # (year, biweek, row, col) flood masks from floodClassification.py
+OUTPUT_CSV = "zonal_flood_stats.csv"
+CONFUSION_CSV = "zonal_confusion.csv"
+
+METERS_PER_DEGREE = 111320.0
+
+# Zones are burnt once into an int32 ID raster on the flood grid (0 = outside every
+# zone). Every statistic afterwards is a bincount over zone_id * n_values + value,
+# so one pass over a raster gives the numbers for all zones at once.
+
+
+# === Step 1: Burn zone indices (1..N) into a raster aligned with the flood grid ===
+def rasterize_zones(geometries, grid, srs=None):
+    if srs is None:
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    ds = gdal.GetDriverByName("MEM").Create("", grid["cols"], grid["rows"], 1, gdal.GDT_Int32)
+    ds.SetGeoTransform(grid["transform"])
+    ds.SetProjection(grid["projection"])
+
+    layer_ds = ogr.GetDriverByName("Memory").CreateDataSource("")
+    layer = layer_ds.CreateLayer("zones", srs, ogr.wkbUnknown)
+    layer.CreateField(ogr.FieldDefn("zid", ogr.OFTInteger))
+    for zid, geom in enumerate(geometries, start=1):
+        feat = ogr.Feature(layer.GetLayerDefn())
+        feat.SetField("zid", zid)
+        feat.SetGeometry(geom)
+        layer.CreateFeature(feat)
+
+    # Pixel centres only (no ALL_TOUCHED), so each pixel's area is counted in exactly one zone;
+    # GDAL reprojects the layer onto the grid if the CRSs differ
+    gdal.RasterizeLayer(ds, [1], layer, options=["ATTRIBUTE=zid"])
+    return ds.GetRasterBand(1).ReadAsArray()
+
+
+# === Step 2: Area of every pixel, corrected for latitude on geographic grids ===
+def pixel_area_m2(grid):
+    srs = osr.SpatialReference(wkt=grid["projection"])
+    _, px_w, _, y_max, _, px_h = grid["transform"]
+    if not srs.IsGeographic():
+        return np.full(grid["rows"], abs(px_w * px_h))
+    lat = y_max + (np.arange(grid["rows"]) + 0.5) * px_h
+    return abs(px_w * px_h) * METERS_PER_DEGREE ** 2 * np.cos(np.radians(lat))
+
+
+class ZoneIndex:
+    # n_zones is the number of rasterized features, so zones that got no pixel centre
+    # (small or off-grid) still get a row with zero pixels
+    def __init__(self, zone_ids, grid, n_zones):
+        self.n_zones = n_zones
+        inside = zone_ids.ravel() > 0
+        # Only pixels inside some zone are ever touched again
+        self.pixels = np.flatnonzero(inside)
+        self.ids = zone_ids.ravel()[self.pixels].astype(np.int64)
+        row_area = pixel_area_m2(grid)
+        self.area = row_area[self.pixels // grid["cols"]]
+        self.zone_pixels = np.bincount(self.ids, minlength=self.n_zones + 1)
+        self.zone_area = np.bincount(self.ids, weights=self.area, minlength=self.n_zones + 1)
+
+    def values(self, raster):
+        return np.asarray(raster).ravel()[self.pixels]
+
+    # Pixel counts and areas of each value 0..n_values-1 per zone from per-pixel
+    # values over self.pixels (see values()): (n_zones + 1, n_values)
+    def histogram(self, values, n_values):
+        code = self.ids * n_values + values
+        size = (self.n_zones + 1) * n_values
+        counts = np.bincount(code, minlength=size).reshape(-1, n_values)
+        area = np.bincount(code, weights=self.area, minlength=size).reshape(-1, n_values)
+        return counts, area
+
+    # TP / FP / FN / TN per zone from boolean pred / gt over self.pixels,
+    # as in calculateTPRandFPRFromRasters: (n_zones + 1, 4)
+    def confusion(self, pred, gt):
+        code = self.ids * 4 + (~pred) * 2 + (~gt)   # TP=0, FP=1, FN=2, TN=3
+        return np.bincount(code, minlength=(self.n_zones + 1) * 4).reshape(-1, 4)
+
+
+# === Step 3: All periods of a (year, biweek, row, col) cube ===
+@traced("zonal_stats")
+def zonal_flood_stats(index, cube):
+    n_years, n_biweeks = cube.shape[:2]
+    counts = np.zeros((n_years, n_biweeks, index.n_zones + 1), dtype=np.int64)
+    area = np.zeros((n_years, n_biweeks, index.n_zones + 1))
+    for yi in range(n_years):
+        for bi in range(n_biweeks):
+            hist_counts, hist_area = index.histogram(index.values(cube[yi, bi]) > 0, 2)
+            counts[yi, bi], area[yi, bi] = hist_counts[:, 1], hist_area[:, 1]
+    return counts, area
+
+
+@traced("zonal_confusion")
+def zonal_confusion(index, cube, ground_truth):
+    gt = index.values(ground_truth) > 0
+    n_years, n_biweeks = cube.shape[:2]
+    result = np.zeros((n_years, n_biweeks, index.n_zones + 1, 4), dtype=np.int64)
+    for yi in range(n_years):
+        for bi in range(n_biweeks):
+            result[yi, bi] = index.confusion(index.values(cube[yi, bi]) > 0, gt)
+    return result
+
+
+def load_zones(path, name_field=ZONE_NAME_FIELD):
+    ds = ogr.Open(path)
+    layer = ds.GetLayer()
+    srs = layer.GetSpatialRef()
+    geometries, names = [], []
+    for feat in layer:
+        geometries.append(feat.GetGeometryRef().Clone())
+        names.append(feat.GetField(name_field) if name_field in feat.keys() else str(feat.GetFID()))
+    return geometries, names, srs.Clone() if srs is not None else None
+
+
+if __name__ == "__main__":
+    store = CompositeStore(COMPOSITE_DIR)
+    geometries, names, srs = load_zones(ZONES_FILE)
+    with span("zonal_rasterize", items=len(geometries)):
+        index = ZoneIndex(rasterize_zones(geometries, store.grid, srs), store.grid, len(geometries))
+    print(f"Rasterized {index.n_zones} zones ({index.pixels.size} pixels)")
+
+    cube = np.load(FLOOD_CUBE, mmap_mode="r")
+    counts, area = zonal_flood_stats(index, cube)
+
+    with open(OUTPUT_CSV, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["zone", "Name", "year", "biweek", "flood_pixels", "flood_area_m2",
+                         "zone_area_m2", "flood_fraction"])
+        for yi, year in enumerate(store.years):
+            for bi in range(cube.shape[1]):
+                for z in range(1, index.n_zones + 1):
+                    zone_area = index.zone_area[z]
+                    writer.writerow([z, names[z - 1], year, bi, counts[yi, bi, z], round(area[yi, bi, z], 1),
+                                     round(zone_area, 1), area[yi, bi, z] / zone_area if zone_area else 0])
+    print("Zonal flood statistics saved to:", OUTPUT_CSV)
+
+    if os.path.exists(GT_RASTER):
+        ground_truth = gdal.Open(GT_RASTER).GetRasterBand(1).ReadAsArray()
+        confusion = zonal_confusion(index, cube, ground_truth)
+        with open(CONFUSION_CSV, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["zone", "Name", "year", "biweek", "TP", "FP", "FN", "TN", "TPR", "FPR"])
+            for yi, year in enumerate(store.years):
+                for bi in range(cube.shape[1]):
+                    for z in range(1, index.n_zones + 1):
+                        tp, fp, fn, tn = confusion[yi, bi, z].tolist()
+                        tpr = tp / (tp + fn) if tp + fn else 0
+                        fpr = fp / (fp + tn) if fp + tn else 0
+                        writer.writerow([z, names[z - 1], year, bi, tp, fp, fn, tn, tpr, fpr])
+        print("Zonal confusion matrices saved to:", CONFUSION_CSV)